@@ -0,0 +1,170 @@
+import heapq
+import time
+from collections import OrderedDict, deque
+
+SPAM_RESET_TIME = 60  # Окно подсчета сообщений, секунд
+MAX_MESSAGES = 50  # Максимальное количество сообщений за окно
+MIN_MESSAGE_INTERVAL = 0.5  # Минимальный интервал между сообщениями
+MAX_KEY_ATTEMPTS = 3  # Максимальное количество попыток ввода ключа
+BLOCK_TIME = 3600  # Время блокировки и хранения попыток в секундах (1 час)
+MAX_TRACKED_USERS = 100000  # Жесткий предел числа отслеживаемых пользователей
+
+# Результаты проверки
+ALLOW = 0
+THROTTLE = 1  # Сообщение пропускаем молча
+BAN = 2  # Пользователь превысил лимиты и должен быть заблокирован
+
+class _UserState:
+    __slots__ = (
+        'last_seen', 'last_message', 'window_start', 'window_count',
+        'prev_count', 'key_attempts', 'blocked_until', 'deadline'
+    )
+
+    def __init__(self, now):
+        self.last_seen = now
+        self.last_message = None
+        self.window_start = now
+        self.window_count = 0
+        self.prev_count = 0
+        self.key_attempts = None  # deque создается только при первой попытке
+        self.blocked_until = 0.0
+        self.deadline = None  # Срок, под которым запись стоит в очереди на удаление
+
+class AbuseControl:
+    # Единый контроль злоупотреблений: лимит частоты сообщений, попытки
+    # ввода ключа и блокировки. Все проверки O(1), состояние хранится
+    # в LRU-словаре с ограничением размера и временем жизни записей.
+    def __init__(self, max_users=MAX_TRACKED_USERS, ttl=BLOCK_TIME, clock=time.monotonic):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.clock = clock
+        self._users = OrderedDict()
+        # Очередь сроков истечения (deadline, user_id): очистка смотрит
+        # только на истекшие записи, а не на весь словарь
+        self._deadlines = []
+
+    def __len__(self):
+        return len(self._users)
+
+    def _state(self, user_id, now, create=True):
+        state = self._users.get(user_id)
+        if state is not None:
+            if now - state.last_seen > self.ttl and state.blocked_until <= now:
+                # Запись устарела: начинаем с чистого листа
+                del self._users[user_id]
+                state = None
+            else:
+                state.last_seen = now
+                self._users.move_to_end(user_id)
+                return state
+        if not create:
+            return None
+
+        self._evict(now)
+        state = _UserState(now)
+        self._users[user_id] = state
+        self._schedule(user_id, state, now + self.ttl)
+        return state
+
+    def _expires_at(self, state):
+        return max(state.last_seen + self.ttl, state.blocked_until)
+
+    def _schedule(self, user_id, state, deadline):
+        state.deadline = deadline
+        heapq.heappush(self._deadlines, (deadline, user_id))
+        # Записи вытесненных пользователей остаются в куче до своего срока;
+        # если их накопилось слишком много, пересобираем кучу по живым записям
+        if len(self._deadlines) > 2 * self.max_users + 1024:
+            self._deadlines = [(s.deadline, uid) for uid, s in self._users.items()]
+            heapq.heapify(self._deadlines)
+
+    def sweep(self, now=None):
+        # Удаляет истекшие записи и возвращает их количество
+        now = self.clock() if now is None else now
+        deadlines = self._deadlines
+        users = self._users
+        evicted = 0
+        while deadlines and deadlines[0][0] <= now:
+            deadline, user_id = heapq.heappop(deadlines)
+            state = users.get(user_id)
+            if state is None or state.deadline != deadline:
+                continue  # Запись уже удалена или переназначена
+            expires_at = self._expires_at(state)
+            if expires_at <= now:
+                del users[user_id]
+                evicted += 1
+            else:
+                # Пользователь был активен: переносим срок вперед
+                self._schedule(user_id, state, expires_at)
+        return evicted
+
+    def _evict(self, now):
+        users = self._users
+        # В начале словаря самые давно активные записи: снимаем устаревшие,
+        # а при переполнении вытесняем самую старую
+        while users:
+            user_id, state = next(iter(users.items()))
+            if now - state.last_seen > self.ttl and state.blocked_until <= now:
+                users.popitem(last=False)
+            elif len(users) >= self.max_users:
+                users.popitem(last=False)
+            else:
+                break
+
+    def is_blocked(self, user_id, now=None):
+        now = self.clock() if now is None else now
+        state = self._users.get(user_id)
+        return state is not None and state.blocked_until > now
+
+    def block(self, user_id, now=None):
+        now = self.clock() if now is None else now
+        self._state(user_id, now).blocked_until = now + BLOCK_TIME
+
+    def check_message(self, user_id, now=None):
+        now = self.clock() if now is None else now
+        state = self._state(user_id, now)
+        if state.blocked_until > now:
+            return BAN
+
+        # Проверка минимального интервала между сообщениями
+        if state.last_message is not None and now - state.last_message < MIN_MESSAGE_INTERVAL:
+            return THROTTLE
+        state.last_message = now
+
+        # Скользящее окно из двух счетчиков: текущее окно и предыдущее
+        elapsed = now - state.window_start
+        if elapsed >= SPAM_RESET_TIME:
+            windows = int(elapsed // SPAM_RESET_TIME)
+            state.prev_count = state.window_count if windows == 1 else 0
+            state.window_count = 0
+            state.window_start += windows * SPAM_RESET_TIME
+            elapsed = now - state.window_start
+        state.window_count += 1
+
+        weight = 1 - elapsed / SPAM_RESET_TIME
+        if state.window_count + state.prev_count * weight > MAX_MESSAGES:
+            state.blocked_until = now + BLOCK_TIME
+            return BAN
+        return ALLOW
+
+    def record_key_attempt(self, user_id, now=None):
+        now = self.clock() if now is None else now
+        state = self._state(user_id, now)
+        if state.key_attempts is None:
+            state.key_attempts = deque(maxlen=MAX_KEY_ATTEMPTS)
+        state.key_attempts.append(now)
+
+    def check_key_attempts(self, user_id, now=None):
+        # Храним только последние MAX_KEY_ATTEMPTS попыток: лимит превышен,
+        # если самая ранняя из них случилась меньше BLOCK_TIME назад
+        now = self.clock() if now is None else now
+        state = self._state(user_id, now, create=False)
+        if state is None:
+            return ALLOW
+        if state.blocked_until > now:
+            return BAN
+        attempts = state.key_attempts
+        if attempts and len(attempts) >= MAX_KEY_ATTEMPTS and now - attempts[0] < BLOCK_TIME:
+            state.blocked_until = now + BLOCK_TIME
+            return BAN
+        return ALLOW
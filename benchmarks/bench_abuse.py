@@ -0,0 +1,85 @@
+# Микробенчмарк контроля злоупотреблений: старые глобальные словари
+# против abuse.AbuseControl на 100 тысячах разных пользователей.
+# Запуск: python benchmarks/bench_abuse.py --users 100000
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import abuse
+
+class LegacyDicts:
+    # Логика rate_limit_check и process_message до перехода на AbuseControl
+    def __init__(self):
+        self.rate_limit = {}
+        self.spam_counter = defaultdict(int)
+        self.key_attempts = defaultdict(list)
+        self.blocked = set()
+
+    def message(self, user_id, now):
+        if user_id in self.rate_limit and now - self.rate_limit[user_id] > abuse.SPAM_RESET_TIME:
+            self.spam_counter[user_id] = 0
+        if user_id in self.rate_limit and now - self.rate_limit[user_id] < abuse.MIN_MESSAGE_INTERVAL:
+            return False
+        self.rate_limit[user_id] = now
+        self.spam_counter[user_id] += 1
+        if self.spam_counter[user_id] > abuse.MAX_MESSAGES:
+            self.blocked.add(user_id)
+            return False
+        self.key_attempts[user_id] = [
+            t for t in self.key_attempts[user_id] if now - t < abuse.BLOCK_TIME
+        ]
+        return True
+
+class Engine:
+    def __init__(self, max_users):
+        self.control = abuse.AbuseControl(max_users=max_users)
+
+    def message(self, user_id, now):
+        if self.control.check_message(user_id, now) != abuse.ALLOW:
+            return False
+        return self.control.check_key_attempts(user_id, now) == abuse.ALLOW
+
+def run(factory, events):
+    # Время меряем без tracemalloc, память - отдельным прогоном
+    impl = factory()
+    start = time.perf_counter()
+    for user_id, now in events:
+        impl.message(user_id, now)
+    elapsed = time.perf_counter() - start
+
+    impl = factory()
+    tracemalloc.start()
+    for user_id, now in events:
+        impl.message(user_id, now)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, impl
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--messages', type=int, default=500000)
+    parser.add_argument('--cap', type=int, default=50000,
+                        help='предел числа записей для AbuseControl')
+    args = parser.parse_args()
+
+    # Сообщения равномерно по времени за 2 часа, пользователи случайные
+    random.seed(1)
+    step = 7200 / args.messages
+    events = [(random.randrange(args.users), i * step) for i in range(args.messages)]
+
+    print(f"Пользователей: {args.users}, сообщений: {args.messages}")
+    for name, factory in (('legacy dicts', LegacyDicts), ('AbuseControl', lambda: Engine(args.cap))):
+        elapsed, peak, impl = run(factory, events)
+        size = len(impl.rate_limit) if isinstance(impl, LegacyDicts) else len(impl.control)
+        print(f"{name:<14} {elapsed / args.messages * 1e9:8.0f} нс/сообщение, "
+              f"пик памяти {peak / 1e6:6.1f} МБ, записей {size}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Выгрузка всей таблицы в .csv.gz (utils.build_export) против XLSX-отчета
+# за тот же период: время и пик памяти Python.
+# Запуск: python benchmarks/bench_export.py --rows 500000
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import migrate
+import utils
+
+def fill(path, rows):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    now = int(time.time())
+    batch = []
+    for user_id in range(1, rows + 1):
+        batch.append((
+            user_id, 19900101, 'Иван', 'Иванов', 'Иванович', '+79999999999',
+            '837, 166; Плотник', random.random() < 0.5, random.random() < 0.5,
+            random.random() < 0.5, random.random() < 0.5,
+            now - random.randint(0, 3 * 365 * 86400)
+        ))
+        if len(batch) >= 10000:
+            _insert(conn, batch)
+            batch = []
+    _insert(conn, batch)
+    conn.close()
+
+def _insert(conn, batch):
+    with conn:
+        conn.executemany('''
+            INSERT INTO users (
+                user_id, birth_date, first_name, last_name, patronymic,
+                phone_number, military_spec, dental_sanation, medical_certificates,
+                foreign_passport, active_contracts, registration_date
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+
+def measure(func, *args):
+    # Время меряем без tracemalloc, память - отдельным прогоном
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--skip-xlsx', action='store_true', help='Не собирать XLSX для сравнения')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.db')
+        fill(path, args.rows)
+        end = int(time.time()) + 1
+
+        content, elapsed, peak = measure(utils.build_export, path, 0, end)
+        print(f"CSV.GZ: {elapsed:.2f} с, {len(content) / 2 ** 20:.1f} МБ, "
+              f"пик памяти {peak / 2 ** 20:.1f} МБ")
+
+        if not args.skip_xlsx:
+            (content, _, _), elapsed, peak = measure(
+                utils.build_report, path, 0, 'за все время', 0
+            )
+            print(f"XLSX:   {elapsed:.2f} с, {len(content) / 2 ** 20:.1f} МБ, "
+                  f"пик памяти {peak / 2 ** 20:.1f} МБ")
+
+if __name__ == '__main__':
+    main()
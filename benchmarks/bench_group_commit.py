@@ -0,0 +1,50 @@
+# Пропускная способность записи регистраций: отдельный commit на каждую
+# строку против групповой записи через Database.add_user_async.
+# Запуск: python benchmarks/bench_group_commit.py --users 2000
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+USER_DATA = {
+    'birth_date': '01.01.1990', 'first_name': 'Иван', 'last_name': 'Иванов',
+    'patronymic': 'Иванович', 'phone_number': '+79999999999', 'military_spec': 'нет',
+    'dental_sanation': True, 'medical_certificates': False,
+    'foreign_passport': True, 'active_contracts': False,
+}
+
+async def per_row(db, user_ids):
+    # Прежнее поведение: каждый обработчик делает свой INSERT и commit
+    await asyncio.gather(*(db._run(db.add_user, user_id, USER_DATA) for user_id in user_ids))
+
+async def batched(db, user_ids):
+    await asyncio.gather(*(db.add_user_async(user_id, USER_DATA) for user_id in user_ids))
+
+def measure(name, func, users):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        start = time.perf_counter()
+        asyncio.run(func(db, range(1, users + 1)))
+        elapsed = time.perf_counter() - start
+        count = db.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        db.close()
+    assert count == users, (name, count)
+    print(f"{name:<10} {elapsed:8.2f} с  {users / elapsed:10.0f} строк/с")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"Одновременных регистраций: {args.users}")
+    measure('per-row', per_row, args.users)
+    measure('batched', batched, args.users)
+
+if __name__ == '__main__':
+    main()
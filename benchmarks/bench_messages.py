@@ -0,0 +1,63 @@
+# Микробенчмарк подготовки ответа на шаге анкеты: прежняя сборка
+# (прогресс-бар, f-строка и новая клавиатура на каждое сообщение)
+# против готовых шаблонов messages.py.
+# Запуск: python benchmarks/bench_messages.py --messages 100000
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import ReplyKeyboardMarkup
+
+import messages
+
+def legacy_progress_bar(current_step):
+    filled = "⬢"
+    empty = "⬡"
+    progress = (current_step / messages.TOTAL_STEPS) * 100
+
+    bar = ""
+    bar += f"\n\n<b>Прогресс заполнения анкеты:</b>\n"
+    bar += filled * current_step + empty * (messages.TOTAL_STEPS - current_step)
+    bar += f" {current_step}/{messages.TOTAL_STEPS} ({progress:.0f}%)\n\n"
+
+    return bar
+
+def legacy_keyboard():
+    return ReplyKeyboardMarkup([['Да', 'Нет']], one_time_keyboard=True, resize_keyboard=True)
+
+def legacy_render(step):
+    # Как обработчики собирали ответ до шаблонов
+    progress = legacy_progress_bar(step)
+    text = (
+        f"{progress}"
+        f"Есть ли у вас санация полости рта?"
+    )
+    return text, legacy_keyboard(), 'HTML'
+
+def template_render(step):
+    message = messages.get_templates('ru')['dental_sanation']
+    return message.text, message.reply_markup, message.parse_mode
+
+def run(render, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        render(5)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    # Тексты должны совпадать, иначе сравнение бессмысленно
+    assert legacy_render(5)[0] == template_render(5)[0]
+
+    for name, render in (('f-строки + новая клавиатура', legacy_render), ('шаблоны', template_render)):
+        elapsed = run(render, args.messages)
+        print(f"{name}: {elapsed * 1e6 / args.messages:.2f} мкс на сообщение")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Сравнение выборки за период на старой схеме и после миграции на схему v2.
+# Запуск: python benchmarks/bench_schema.py --rows 200000
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import migrate, get_schema_version, to_timestamp, _migration_1_legacy
+
+QUERY = '''
+    SELECT last_name, first_name, patronymic, birth_date, phone_number,
+        military_spec, dental_sanation, medical_certificates,
+        foreign_passport, active_contracts, registration_date
+    FROM users
+    WHERE registration_date >= ?
+    ORDER BY registration_date DESC
+'''
+
+def fill_legacy(conn, rows):
+    # Заполняем таблицу в старом формате: даты строками, как писал прежний add_user
+    _migration_1_legacy(conn)
+    now = datetime.now()
+    batch = []
+    for user_id in range(1, rows + 1):
+        registered = now - timedelta(seconds=random.randint(0, 3 * 365 * 86400))
+        batch.append((
+            user_id, '01.01.1990', 'Иван', 'Иванов', 'Иванович', '+79999999999',
+            '837; Плотник', random.random() < 0.5, random.random() < 0.5,
+            random.random() < 0.5, random.random() < 0.5, registered
+        ))
+        if len(batch) >= 10000:
+            _insert(conn, batch)
+            batch = []
+    _insert(conn, batch)
+    conn.commit()
+
+def _insert(conn, batch):
+    conn.executemany('''
+    INSERT INTO users (
+        user_id, birth_date, first_name, last_name, patronymic,
+        phone_number, military_spec, dental_sanation, medical_certificates,
+        foreign_passport, active_contracts, registration_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', batch)
+
+def time_queries(conn, params, repeat):
+    results = {}
+    for name, param in params.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = len(conn.execute(QUERY, (param,)).fetchall())
+            best = min(best, time.perf_counter() - start)
+        results[name] = (best, count)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    now = datetime.now()
+    periods = {
+        'day': now.replace(hour=0, minute=0, second=0, microsecond=0),
+        'week': now - timedelta(days=7),
+        'month': now - timedelta(days=30),
+        'year': now - timedelta(days=365),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        fill_legacy(conn, args.rows)
+        size_before = os.path.getsize(path)
+
+        # Старая схема сравнивает строки без индекса
+        before = time_queries(conn, periods, args.repeat)
+
+        start = time.perf_counter()
+        migrate(conn)
+        migration_time = time.perf_counter() - start
+        version = get_schema_version(conn)
+        conn.execute('VACUUM')
+        size_after = os.path.getsize(path)
+
+        after = time_queries(
+            conn, {name: to_timestamp(value) for name, value in periods.items()}, args.repeat
+        )
+        conn.close()
+
+    print(f"Строк: {args.rows}, версия схемы: 0 -> {version}")
+    print(f"Миграция: {migration_time:.2f} с, размер БД: {size_before / 1e6:.1f} -> {size_after / 1e6:.1f} МБ")
+    print(f"{'Период':<8}{'строк':>9}{'v1, мс':>12}{'v2, мс':>12}{'ускорение':>12}")
+    for name in periods:
+        old_time, count = before[name]
+        new_time, new_count = after[name]
+        assert count == new_count, (name, count, new_count)
+        print(f"{name:<8}{count:>9}{old_time * 1000:>12.2f}{new_time * 1000:>12.2f}"
+              f"{old_time / new_time:>11.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Поиск /find по FTS5 (Database.search_users) на большой таблице users
+# против LIKE по тем же полям, плюс цена триггеров индекса при вставке.
+# Запуск: python benchmarks/bench_search.py --rows 1000000
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, migrate
+
+LAST_NAMES = ('Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Ёлкин', 'Соколов')
+FIRST_NAMES = ('Иван', 'Петр', 'Алексей', 'Сергей', 'Андрей', 'Дмитрий', 'Артём', 'Михаил')
+PATRONYMICS = ('Иванович', 'Петрович', 'Сергеевич', 'Андреевич', 'Олегович')
+PROFESSIONS = ('Плотник', 'Маляр', 'Крановщик', 'Водитель', 'Сварщик')
+
+QUERIES = ('ив', 'иванов иван', 'елкин арт', 'сидоров петр сер', '7999123', '837 сварщ', 'нетакого')
+
+LIKE_QUERY = '''
+    SELECT user_id FROM users
+    WHERE last_name LIKE ? OR first_name LIKE ? OR patronymic LIKE ?
+        OR phone_number LIKE ? OR military_spec LIKE ?
+    ORDER BY user_id DESC LIMIT 10
+'''
+
+def make_row(user_id, now):
+    # Фамилии с числовым суффиксом, чтобы слова не повторялись бесконечно
+    return (
+        user_id, 19900101,
+        random.choice(FIRST_NAMES), f'{random.choice(LAST_NAMES)}{random.randint(0, 999) or ""}',
+        random.choice(PATRONYMICS), f'+7{random.randint(9000000000, 9999999999)}',
+        f'{random.randint(100, 999)}; {random.choice(PROFESSIONS)}',
+        0, 0, 0, 0, now
+    )
+
+def fill(path, rows, schema=None):
+    conn = sqlite3.connect(path)
+    migrate(conn, *(() if schema is None else (schema,)))
+    now = int(time.time())
+    started = time.perf_counter()
+    for offset in range(0, rows, 10000):
+        batch = [make_row(user_id, now) for user_id in range(offset + 1, min(offset + 10000, rows) + 1)]
+        with conn:
+            conn.executemany('''
+                INSERT INTO users (
+                    user_id, birth_date, first_name, last_name, patronymic,
+                    phone_number, military_spec, dental_sanation, medical_certificates,
+                    foreign_passport, active_contracts, registration_date
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+    conn.close()
+    return time.perf_counter() - started
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.db')
+        plain = fill(os.path.join(tmp, 'plain.db'), args.rows, schema=3)
+        indexed = fill(path, args.rows)
+        print(f"Вставка {args.rows} строк: без индекса {plain:.1f} с, с FTS5 {indexed:.1f} с")
+
+        db = Database(path)
+        for text in QUERIES:
+            rows, elapsed = timed(lambda: db.search_users(text, 10))
+            words = text.split()
+            with db.reader() as conn:
+                _, like = timed(lambda: conn.execute(LIKE_QUERY, (f'%{words[0]}%',) * 5).fetchall(), 1)
+            print(f"{text!r:22} FTS5 {elapsed * 1000:8.2f} мс ({len(rows)} строк), "
+                  f"LIKE по первому слову {like * 1000:8.1f} мс")
+        db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# Холодный старт бота: время импорта bot.py (по python -X importtime) и время
+# от запуска процесса до ответа на первое обновление (/start). Бот работает
+# в отдельном процессе во временном каталоге с БД на --rows анкет, Bot API
+# подменяется локальным сервером из load_test.py. Результат сравнивается
+# с бюджетом из startup_budget.json, при превышении код возврата 1.
+# Запуск: python benchmarks/bench_startup.py --rows 100000 --output startup.json
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+BUDGET_PATH = os.path.join(BENCH_DIR, 'startup_budget.json')
+CHAT_ID = 1000001
+FIRST_UPDATE_TIMEOUT = 60  # Сколько ждем ответа бота, секунд
+TOP_IMPORTS = 10  # Сколько самых тяжелых модулей показывать
+
+def fill(path, rows):
+    # БД с анкетами, чтобы первое обновление включало открытие и прогрев кэша
+    from database import migrate
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    now = int(time.time())
+    for offset in range(0, rows, 10000):
+        batch = [
+            (user_id, 19900101, 'Иван', 'Иванов', 'Иванович', f'+7999{user_id:07d}',
+             '837; Плотник', 0, 0, 0, 0, now, 79990000000 + user_id)
+            for user_id in range(offset + 1, min(offset + 10000, rows) + 1)
+        ]
+        with conn:
+            conn.executemany('''
+                INSERT INTO users (
+                    user_id, birth_date, first_name, last_name, patronymic,
+                    phone_number, military_spec, dental_sanation, medical_certificates,
+                    foreign_passport, active_contracts, registration_date, phone_key
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+    conn.close()
+
+def measure_imports(cwd):
+    # Возвращает суммарное время импорта bot в мс, самые тяжелые модули
+    # и файлы, появившиеся в каталоге при импорте (их быть не должно)
+    before = set(os.listdir(cwd))
+    # Общее состояние в SQLite, как у воркеров launcher.py: его файл тоже
+    # не должен создаваться при импорте
+    env = dict(os.environ, PYTHONPATH=ROOT, STATE_BACKEND='sqlite')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import bot'],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:   self |  cumulative | name"
+        head, cumulative_us, name = line.split('|')
+        self_us = head.split(':')[1]
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    total = next(cumulative for name, _, cumulative in modules if name == 'bot')
+    heaviest = sorted(modules, key=lambda module: module[1], reverse=True)[:TOP_IMPORTS]
+    created = sorted(set(os.listdir(cwd)) - before)
+    return total / 1000, [(name, self_us / 1000) for name, self_us, _ in heaviest], created
+
+async def measure_first_update(cwd):
+    # Время от запуска процесса бота до получения сервером ответа на /start
+    from load_test import FakeBotApi, TOKEN
+
+    api = FakeBotApi()
+    await api.start()
+    env = dict(
+        os.environ, PYTHONPATH=ROOT, BOT_TOKEN=TOKEN, BOT_API_URL=api.base_url, METRICS_PORT=''
+    )
+    inbox = api.inbox(CHAT_ID)
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), '--child', cwd=cwd, env=env
+    )
+    try:
+        await asyncio.wait_for(inbox.get(), FIRST_UPDATE_TIMEOUT)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        await process.wait()
+        await api.stop()
+    return elapsed * 1000
+
+async def child():
+    # Процесс бота: то же, что делает run_polling до первого обновления,
+    # только обновление подается прямо в очередь
+    import bot
+    from telegram import Update
+
+    application = bot.build_application()
+    await application.initialize()
+    await application.start()
+    await application.update_queue.put(Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': CHAT_ID, 'type': 'private'},
+            'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Тест', 'language_code': 'ru'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }, application.bot))
+    # Процесс завершает родитель, получив ответ
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000, help='Анкет в БД бота')
+    parser.add_argument('--runs', type=int, default=3, help='Запусков, берется лучший')
+    parser.add_argument('--output', default='startup.json')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child())
+        return
+
+    with open(BUDGET_PATH, encoding='utf-8') as f:
+        budget = json.load(f)
+    output = os.path.abspath(args.output)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import_ms, heaviest, created = min(
+            (measure_imports(tmp) for _ in range(args.runs)), key=lambda result: result[0]
+        )
+        fill(os.path.join(tmp, 'users.db'), args.rows)
+        first_update_ms = min(
+            asyncio.run(measure_first_update(tmp)) for _ in range(args.runs)
+        )
+
+    from load_test import git_commit
+    result = {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'rows': args.rows,
+        'import_ms': round(import_ms, 1),
+        'first_update_ms': round(first_update_ms, 1),
+        'files_created_on_import': created,
+        'heaviest_imports_ms': {name: round(ms, 1) for name, ms in heaviest},
+        'budget': budget,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"Импорт bot: {import_ms:.0f} мс (бюджет {budget['import_ms']} мс)")
+    print(f"Первое обновление: {first_update_ms:.0f} мс (бюджет {budget['first_update_ms']} мс)")
+    print("Самые тяжелые модули, мс: " + ', '.join(f"{name} {ms:.0f}" for name, ms in heaviest))
+    if created:
+        print(f"При импорте созданы файлы: {', '.join(created)}")
+    print(f"Результат сохранен в {output}")
+
+    over = import_ms > budget['import_ms'] or first_update_ms > budget['first_update_ms']
+    if over or created:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Локальный стенд для режима webhook: поднимает WebhookServer, отправляет
+# ему POST-запросы с поддельными обновлениями Telegram и меряет задержку
+# от отправки до появления обновления в application.update_queue.
+# Сеть не нужна: бот не инициализируется, запросы к Bot API не делаются.
+# Запуск: python benchmarks/bench_webhook.py --updates 5000 --concurrency 50
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from telegram.ext import Application
+
+from webhook import WebhookServer, SECRET_HEADER
+
+SECRET = 'bench-secret'
+
+def fake_update(update_id):
+    user_id = 100000 + update_id % 1000
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': '01.01.1990',
+        },
+    }
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def run(args):
+    application = Application.builder().token('123:TEST').updater(None).build()
+    server = WebhookServer(application, port=0, secret_token=SECRET, workers=args.workers)
+    await server.start()
+
+    sent = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def consume():
+        while len(latencies) < args.updates:
+            update = await application.update_queue.get()
+            latencies.append(time.perf_counter() - sent[update.update_id])
+        done.set()
+
+    consumer = asyncio.create_task(consume())
+    bodies = [json.dumps(fake_update(i)).encode() for i in range(args.updates)]
+    url = f'http://127.0.0.1:{server.port}{server.path}'
+    headers = {SECRET_HEADER: SECRET, 'Content-Type': 'application/json'}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        async def post(update_id, body):
+            async with semaphore:
+                sent[update_id] = time.perf_counter()
+                async with session.post(url, data=body, headers=headers) as response:
+                    assert response.status == 200, response.status
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(i, body) for i, body in enumerate(bodies)))
+        await done.wait()
+        elapsed = time.perf_counter() - start
+
+    await consumer
+    await server.stop()
+
+    print(f"Обновлений: {args.updates}, параллельных запросов: {args.concurrency}, "
+          f"задач разбора: {args.workers}")
+    print(f"Пропускная способность: {args.updates / elapsed:.0f} обновлений/с")
+    print(f"Задержка до update_queue, мс: "
+          f"p50={percentile(latencies, 50) * 1000:.2f} "
+          f"p95={percentile(latencies, 95) * 1000:.2f} "
+          f"p99={percentile(latencies, 99) * 1000:.2f} "
+          f"mean={statistics.mean(latencies) * 1000:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == '__main__':
+    main()
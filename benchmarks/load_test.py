@@ -0,0 +1,365 @@
+# Нагрузочный тест бота целиком: N пользователей одновременно проходят анкету
+# от /start до process_active_contracts, админы параллельно запрашивают отчеты.
+# Вместо Telegram поднимается локальный сервер Bot API (aiohttp), обновления
+# подаются прямо в application.update_queue. Бот работает во временном каталоге
+# со своей пустой БД. Задержка меряется от подачи обновления до получения
+# сервером ответа бота. Результат сохраняется в JSON, чтобы сравнивать коммиты.
+# По умолчанию лимиты очереди отправки сняты и меряется сам бот. С флагом
+# --telegram-limits сервер, как Telegram, отвечает 429 при превышении лимитов,
+# а --flood-every N дополнительно отвечает 429 на каждый N-й sendMessage.
+# Запуск: python benchmarks/load_test.py --users 500 --admins 2 --output load.json
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web
+from telegram import Update
+
+TOKEN = '123456:LOADTEST'
+ADMIN_KEY = 'load-test-admin-key-0123456789'
+REPLY_TIMEOUT = 60  # Сколько ждем ответа бота, секунд
+
+# Шаги анкеты: название и текст, который отправляет пользователь.
+# {user_id} подставляется: бот не принимает один номер от разных аккаунтов
+CONVERSATION = [
+    ('start', '/start'),
+    ('birth_date', '01.01.1990'),
+    ('full_name', 'Иванов Иван Иванович'),
+    ('phone_number', '8999{user_id:07d}'),
+    ('military_spec', '837, 166; Плотник'),
+    ('dental_sanation', 'Да'),
+    ('medical_certificates', 'Нет'),
+    ('foreign_passport', 'Да'),
+    ('active_contracts', 'Нет'),
+]
+REPORT_PERIODS = ('day', 'week', 'month', 'year')
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def summary(values):
+    # Перцентили в миллисекундах
+    return {
+        'count': len(values),
+        'p50': _ms(percentile(values, 50)),
+        'p95': _ms(percentile(values, 95)),
+        'p99': _ms(percentile(values, 99)),
+        'max': _ms(max(values) if values else None),
+    }
+
+def _ms(value):
+    return None if value is None else round(value * 1000, 3)
+
+class FakeBotApi:
+    # Минимальный Bot API: отвечает на методы, которые вызывает бот,
+    # и передает каждый ответ бота ожидающему его пользователю
+    def __init__(self, latency=0.0, enforce_limits=False, flood_every=0):
+        self.latency = latency
+        self.enforce_limits = enforce_limits
+        self.flood_every = flood_every
+        self.calls = {}
+        self.rate_limited = 0
+        self._global = None
+        self._chats = {}
+        self._waiters = {}  # chat_id -> очередь (метод, время получения)
+        self._message_id = 0
+        self._runner = None
+        self.port = None
+
+    def inbox(self, chat_id):
+        return self._waiters.setdefault(chat_id, asyncio.Queue())
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Load', 'username': 'load_test_bot'}
+        elif method in ('sendMessage', 'sendDocument'):
+            chat_id = int(params['chat_id'])
+            retry_after = self._check_limits(method, chat_id)
+            if retry_after:
+                self.rate_limited += 1
+                return web.json_response({
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                }, status=429)
+            self._message_id += 1
+            result = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+            }
+            self.inbox(chat_id).put_nowait((method, time.perf_counter()))
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def _check_limits(self, method, chat_id):
+        # Возвращает retry_after, если запрос нужно отклонить
+        if self.flood_every and method == 'sendMessage' and self.calls[method] % self.flood_every == 0:
+            return 1
+        if not self.enforce_limits:
+            return 0
+        # Лимиты как у очереди отправки бота; модуль импортируется после
+        # настройки окружения в main
+        import sender
+        now = time.monotonic()
+        if self._global is None:
+            self._global = sender.TokenBucket(sender.OUTBOUND_RATE, sender.OUTBOUND_BURST, now)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = sender.TokenBucket(
+                sender.OUTBOUND_CHAT_RATE, sender.OUTBOUND_CHAT_BURST, now
+            )
+        # Небольшой допуск на неточность часов между клиентом и сервером
+        if self._global.delay(now) > 0.05 or chat.delay(now) > 0.05:
+            return 1
+        self._global.take()
+        chat.take()
+        return 0
+
+class Simulation:
+    def __init__(self, application, api):
+        self.application = application
+        self.api = api
+        self.update_id = 0
+        self.message_id = 0
+        self.latencies = []
+        self.per_step = {name: [] for name, _ in CONVERSATION}
+        self.report_latencies = []
+        self.errors = 0
+        self.updates = 0
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': 'Тест', 'language_code': 'ru'}
+
+    def _message(self, user_id, text):
+        self.message_id += 1
+        message = {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+        return message
+
+    async def _send(self, data, user_id, expect='sendMessage'):
+        # Подает обновление боту и ждет ответа указанным методом
+        self.update_id += 1
+        data['update_id'] = self.update_id
+        update = Update.de_json(data, self.application.bot)
+        inbox = self.api.inbox(user_id)
+        started = time.perf_counter()
+        self.updates += 1
+        await self.application.update_queue.put(update)
+        try:
+            while True:
+                method, received = await asyncio.wait_for(inbox.get(), REPLY_TIMEOUT)
+                if method == expect:
+                    return received - started
+        except asyncio.TimeoutError:
+            self.errors += 1
+            return None
+
+    async def user(self, user_id):
+        for step, text in CONVERSATION:
+            text = text.format(user_id=user_id)
+            latency = await self._send({'message': self._message(user_id, text)}, user_id)
+            if latency is None:
+                return
+            self.latencies.append(latency)
+            self.per_step[step].append(latency)
+
+    async def admin(self, user_id, reports):
+        latency = await self._send({'message': self._message(user_id, ADMIN_KEY)}, user_id)
+        if latency is None:
+            return
+        self.latencies.append(latency)
+        for i in range(reports):
+            self.message_id += 1
+            callback = {
+                'id': str(self.update_id),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'data': f'report_{REPORT_PERIODS[i % len(REPORT_PERIODS)]}',
+                'message': {
+                    'message_id': self.message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': 'report',
+                },
+            }
+            latency = await self._send({'callback_query': callback}, user_id, expect='sendDocument')
+            if latency is not None:
+                self.report_latencies.append(latency)
+
+class SQLiteTimer:
+    # Считает время, проведенное в функциях, которые выполняются в потоках БД
+    def __init__(self):
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, name):
+        run = owner._run
+        self.seconds[name] = 0.0
+
+        async def timed_run(func, *args):
+            def timed(*call_args):
+                started = time.perf_counter()
+                try:
+                    return func(*call_args)
+                finally:
+                    with self._lock:
+                        self.seconds[name] += time.perf_counter() - started
+            return await run(timed, *args)
+
+        owner._run = timed_run
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args):
+    api = FakeBotApi(
+        latency=args.api_latency / 1000,
+        enforce_limits=args.telegram_limits,
+        flood_every=args.flood_every
+    )
+    await api.start()
+    os.environ.update({'BOT_TOKEN': TOKEN, 'ADMIN_KEY': ADMIN_KEY, 'BOT_API_URL': api.base_url})
+
+    # Бот создает БД и файлы состояния в текущем каталоге при первом обращении
+    import bot
+    import sender
+    application = bot.build_application()
+    timer = SQLiteTimer()
+    timer.wrap(bot.db, 'users')
+    timer.wrap(application.persistence, 'persistence')
+
+    simulation = Simulation(application, api)
+    await application.initialize()
+    await application.start()
+
+    started = time.perf_counter()
+    tasks = [simulation.user(1000000 + i) for i in range(args.users)]
+    tasks += [simulation.admin(900 + i, args.reports) for i in range(args.admins)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    await sender.outbox.join()
+    await application.stop()
+    await application.shutdown()
+    await api.stop()
+    bot.report_pool.shutdown()
+    bot.db.close()
+
+    conn = sqlite3.connect(bot.db.path)
+    registered = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    conn.close()
+
+    return {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'users': args.users,
+        'admins': args.admins,
+        'reports_per_admin': args.reports,
+        'api_latency_ms': args.api_latency,
+        'elapsed_seconds': round(elapsed, 3),
+        'updates': simulation.updates,
+        'updates_per_second': round(simulation.updates / elapsed, 1),
+        'errors': simulation.errors,
+        'registered': registered,
+        'latency_ms': summary(simulation.latencies),
+        'per_step_ms': {step: summary(values) for step, values in simulation.per_step.items()},
+        'report_ms': summary(simulation.report_latencies),
+        'sqlite_seconds': {name: round(value, 3) for name, value in timer.seconds.items()},
+        'bot_api_calls': api.calls,
+        'telegram_limits': args.telegram_limits,
+        'rate_limited_responses': api.rate_limited,
+        'outbound': {
+            'sent': sender.outbox.sent,
+            'retried': sender.outbox.retried,
+            'failed': sender.outbox.failed,
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--reports', type=int, default=4, help='Отчетов на одного админа')
+    parser.add_argument('--api-latency', type=float, default=0.0,
+                        help='Задержка ответа Bot API, мс')
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help='Лимиты отправки как у Telegram, сервер отвечает 429')
+    parser.add_argument('--flood-every', type=int, default=0,
+                        help='Отвечать 429 на каждый N-й sendMessage')
+    parser.add_argument('--output', default='load_test.json')
+    args = parser.parse_args()
+    if not args.telegram_limits:
+        # Снимаем лимиты очереди отправки, чтобы мерить производительность бота
+        os.environ.setdefault('OUTBOUND_RATE', '1000000')
+        os.environ.setdefault('OUTBOUND_CHAT_RATE', '1000000')
+    output = os.path.abspath(args.output)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        result = asyncio.run(run(args))
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    latency = result['latency_ms']
+    print(f"Пользователей: {args.users}, админов: {args.admins}, ошибок: {result['errors']}, "
+          f"сохранено анкет: {result['registered']}")
+    print(f"Обновлений/с: {result['updates_per_second']}")
+    print(f"Задержка обработчиков, мс: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+    print(f"Отчеты, мс: p50={result['report_ms']['p50']} p95={result['report_ms']['p95']}")
+    print(f"Время в SQLite, с: {result['sqlite_seconds']}")
+    print(f"Ответов 429: {result['rate_limited_responses']}, отправка: {result['outbound']}")
+    print(f"Результат сохранен в {output}")
+
+if __name__ == '__main__':
+    main()
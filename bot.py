@@ -1,20 +1,32 @@
 import os
-import re
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardRemove
+from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters,
     ConversationHandler, CallbackQueryHandler, ContextTypes
 )
 from database import Database
-from keyboards import get_yes_no_keyboard, get_report_period_keyboard
+from lazy import Lazy, loaded
+from persistence import SQLitePersistence
+from scheduler import PerUserUpdateProcessor
+import abuse
+import state
+import messages
+import metrics
+from sender import outbox
 import utils
+from validation import (
+    validate_date, validate_name, validate_phone, validate_military_spec, validate_vus_code
+)
 # import phonenumbers  # Добавьте в requirements.txt: phonenumbers==8.13.32
 import sqlite3
-from collections import defaultdict
-import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
 import logging
+import time
+from datetime import datetime, timedelta
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -25,7 +37,6 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-ADMIN_USERS = set()  # Множество для хранения ID админов
 
 (
     BIRTH_DATE, FIRST_NAME, LAST_NAME, PATRONYMIC, PHONE_NUMBER,
@@ -33,153 +44,80 @@ ADMIN_USERS = set()  # Множество для хранения ID админ
     FOREIGN_PASSPORT, ACTIVE_CONTRACTS
 ) = range(10)
 
-db = Database()
-
-RATE_LIMIT = {}  # Словарь для отслеживания времени между сообщениями
-SPAM_COUNTER = defaultdict(int)
-SPAM_RESET_TIME = 60  # Сброс счетчика спама через 60 секунд
-MAX_MESSAGES = 50  # Увеличим максимальное количество сообщений в минуту
-MIN_MESSAGE_INTERVAL = 0.5  # Уменьшим минимальный интервал между сообщениями до 0.5 секунды
-
-# Словари для отслеживания попыток
-KEY_ATTEMPTS = defaultdict(list)
-BLOCKED_USERS = set()
-MAX_KEY_ATTEMPTS = 3  # Максимальное количество попыток ввода ключа
-BLOCK_TIME = 3600  # Время блокировки в секундах (1 час)
-
-TOTAL_STEPS = 8  # Общее количество шагов
-STEPS = {
-    BIRTH_DATE: 1,
-    FIRST_NAME: 2,
-    PHONE_NUMBER: 3,
-    MILITARY_SPEC: 4,
-    DENTAL_SANATION: 5,
-    MEDICAL_CERTIFICATES: 6,
-    FOREIGN_PASSPORT: 7,
-    ACTIVE_CONTRACTS: 8
+# Имена состояний для метрик
+STATE_NAMES = {
+    BIRTH_DATE: 'BIRTH_DATE', FIRST_NAME: 'FIRST_NAME', LAST_NAME: 'LAST_NAME',
+    PATRONYMIC: 'PATRONYMIC', PHONE_NUMBER: 'PHONE_NUMBER', MILITARY_SPEC: 'MILITARY_SPEC',
+    DENTAL_SANATION: 'DENTAL_SANATION', MEDICAL_CERTIFICATES: 'MEDICAL_CERTIFICATES',
+    FOREIGN_PASSPORT: 'FOREIGN_PASSPORT', ACTIVE_CONTRACTS: 'ACTIVE_CONTRACTS',
 }
 
-def generate_progress_bar(current_step):
-    filled = "⬢"  # Заполненный символ
-    empty = "⬡"   # Пустой символ
-    progress = (current_step / TOTAL_STEPS) * 100
-    
-    bar = ""
-    bar += f"\n\n<b>Прогресс заполнения анкеты:</b>\n"
-    bar += filled * current_step + empty * (TOTAL_STEPS - current_step)
-    bar += f" {current_step}/{TOTAL_STEPS} ({progress:.0f}%)\n\n"
-    
-    return bar
+# БД, пул отчетов и общее состояние создаются при первом обращении,
+# а не при импорте модуля
+db = Lazy(Database)
+# Отчеты собираются в отдельных процессах, чтобы не останавливать бота
+REPORT_WORKERS = 2
+report_pool = Lazy(
+    ProcessPoolExecutor,
+    max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context('spawn')
+)
+report_cache = utils.ReportCache(db, executor=report_pool)
+
+# Админы, лимиты сообщений, попытки ввода ключа и блокировки.
+# STATE_BACKEND=sqlite делает админов и блокировки общими для нескольких воркеров.
+shared_state = Lazy(state.create_state)
+update_processor = PerUserUpdateProcessor()
+CLEANUP_INTERVAL = 60  # Период фоновой очистки устаревших данных, секунд
+FIND_PAGE_SIZE = 10  # Результатов /find на одной странице
+
+metrics.add_collector(
+    'bot_update_queue_depth', 'Обновления, ждущие обработки', lambda: update_processor.queued
+)
+metrics.add_collector(
+    'bot_updates_in_flight', 'Обновления в обработке', lambda: update_processor.in_flight
+)
+metrics.add_collector(
+    'bot_outbound_pending', 'Сообщения в очереди отправки', lambda: outbox.pending
+)
+metrics_server = None
 
 async def rate_limit_check(user_id):
-    current_time = time.time()
-    
-    # Сброс счетчика если прошла минута
-    if user_id in RATE_LIMIT and current_time - RATE_LIMIT[user_id] > SPAM_RESET_TIME:
-        SPAM_COUNTER[user_id] = 0
-    
-    # Проверка минимального интервала между сообщениями
-    if user_id in RATE_LIMIT:
-        time_diff = current_time - RATE_LIMIT[user_id]
-        if time_diff < MIN_MESSAGE_INTERVAL:  # Уменьшенный интервал
-            return False
-    
-    RATE_LIMIT[user_id] = current_time
-    SPAM_COUNTER[user_id] += 1
+    verdict = shared_state.check_message(user_id)
     
     # Если превышен лимит сообщений в минуту
-    if SPAM_COUNTER[user_id] > MAX_MESSAGES:
-        db.ban_user(user_id)
-        BLOCKED_USERS.add(user_id)
+    if verdict == abuse.BAN:
+        await db.ban_user_async(user_id)
         return False
             
-    return True
-
-def validate_date(date_str):
-    try:
-        birth_date = datetime.strptime(date_str, '%d.%m.%Y')
-        today = datetime.now()
-        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-        
-        if age < 18 or age > 65:
-            return False
-        return True
-    except ValueError:
-        return False
-
-def validate_name(name):
-    return bool(re.match(r'^[А-ЯЁа-яё\s-]{2,50}$', name))
-
-def validate_phone(phone_str):
-    try:
-        # Удаляем все пробелы и другие символы из номера
-        phone_str = ''.join(filter(str.isdigit, phone_str))
-        
-        # Проверяем длину номера (от 10 до 15 цифр по международному стандарту)
-        if not (10 <= len(phone_str) <= 15):
-            return False, None
-            
-        # Если номер начинается с 8, считаем его российским
-        if phone_str.startswith('8'):
-            formatted_number = '+7' + phone_str[1:]
-        # Если начинается с 7, добавляем +
-        elif phone_str.startswith('7'):
-            formatted_number = '+' + phone_str
-        # Если короткий номер (10 цифр), считаем российским
-        elif len(phone_str) == 10:
-            formatted_number = '+7' + phone_str
-        # Иначе добавляем + для международного формата
-        else:
-            formatted_number = '+' + phone_str
-            
-        return True, formatted_number
-        
-    except Exception:
-        return False, None
+    return verdict == abuse.ALLOW
 
 async def start(update: Update, context):
     user_id = update.effective_user.id
+    templates = messages.for_update(update)
     
     # Сначала проверяем, не является ли сообщение секретным ключом
     if update.message.text == os.getenv('ADMIN_KEY'):
-        ADMIN_USERS.add(user_id)  # Добавляем пользователя в множество админов
-        await update.message.reply_text(
-            "Выберите период для отчета:",
-            reply_markup=get_report_period_keyboard()
-        )
+        shared_state.add_admin(user_id)  # Добавляем пользователя в множество админов
+        await templates['choose_report_period'].send(update.message)
         return ConversationHandler.END
 
-    if db.is_user_banned(user_id):
-        await update.message.reply_text("Доступ запрещен.")
+    if await db.is_user_banned_async(user_id):
+        await templates['access_denied'].send(update.message)
         return ConversationHandler.END
     
-    attempts = db.get_user_attempts(user_id)
-    if attempts >= 3:
-        await update.message.reply_text(
-            "Вы уже использовали максимальное количество попыток регистрации (3)."
-        )
+    attempts = await db.get_user_attempts_async(user_id)
+    if attempts >= messages.MAX_REGISTRATION_ATTEMPTS:
+        await templates['attempts_exhausted'].send(update.message)
         return ConversationHandler.END
     
     context.user_data.clear()
-    progress = generate_progress_bar(1)
-    await update.message.reply_text(
-        f"Здравствуйте! Для продолжения регистрации, пожалуйста, "
-        f"ответьте на несколько вопросов.\n\n"
-        f"У вас осталось {3 - attempts} попыток регистрации."
-        f"{progress}"
-        f"Укажите вашу дату рождения в формате ДД.ММ.ГГГГ\n"
-        f"Например: 01.01.1990",
-        parse_mode='HTML'
-    )
+    await templates.start(messages.MAX_REGISTRATION_ATTEMPTS - attempts).send(update.message)
     return BIRTH_DATE
 
 async def process_birth_date(update: Update, context):
     # Проверяем секретный ключ и здесь тоже
     if update.message.text == os.getenv('ADMIN_KEY'):
-        await update.message.reply_text(
-            "Выберите период для отчета:",
-            reply_markup=get_report_period_keyboard()
-        )
+        await messages.for_update(update)['choose_report_period'].send(update.message)
         return ConversationHandler.END
 
     logger.info("Processing birth date: %s", update.message.text)
@@ -191,84 +129,55 @@ async def process_birth_date(update: Update, context):
     
     if not validate_date(birth_date):
         logger.info("Invalid date format: %s", birth_date)
-        await update.message.reply_text(
-            "Неверный формат даты или возраст не соответствует требованиям (18-65 лет).\n"
-            "Пожалуйста, используйте формат ДД.ММ.ГГГГ\n"
-            "Например: 01.01.1990"
-        )
+        await messages.for_update(update)['birth_date_invalid'].send(update.message)
         return BIRTH_DATE
     
     logger.info("Valid date received: %s", birth_date)
     context.user_data['birth_date'] = birth_date
-    progress = generate_progress_bar(STEPS[FIRST_NAME])
-    await update.message.reply_text(
-        f"{progress}"
-        f"Введите ваши ФИО (Фамилия Имя Отчество).\n"
-        f"Пример: Иванов Иван Иванович\n"
-        f"Используйте только русские буквы, пробел и дефис.",
-        parse_mode='HTML'
-    )
+    await messages.for_update(update)['full_name'].send(update.message)
     return FIRST_NAME
 
 async def process_first_name(update: Update, context):
+    templates = messages.for_update(update)
     full_name = update.message.text.split()
     
     if len(full_name) != 3:
-        await update.message.reply_text(
-            "Пожалуйста, введите полные ФИО через пробел.\n"
-            "Пример: Иванов Иван Иванович"
-        )
+        await templates['full_name_incomplete'].send(update.message)
         return FIRST_NAME
     
     last_name, first_name, patronymic = full_name
     
     if not all(validate_name(name) for name in [last_name, first_name, patronymic]):
-        await update.message.reply_text(
-            "Неверный формат ФИО. Используйте только русские буквы, пробел и дефис.\n"
-            "Пример: Иванов Иван Иванович"
-        )
+        await templates['full_name_invalid'].send(update.message)
         return FIRST_NAME
     
     context.user_data['last_name'] = last_name
     context.user_data['first_name'] = first_name
     context.user_data['patronymic'] = patronymic
     
-    await update.message.reply_text(
-        "Введите ваш номер телефона.\n"
-        "Например: +79999999999 или 89999999999"
-    )
+    await templates['phone_number'].send(update.message)
     return PHONE_NUMBER
 
 async def process_last_name(update: Update, context):
     last_name = update.message.text
     
     if not validate_name(last_name):
-        await update.message.reply_text(
-            "Неверный формат фамилии. Используйте только русские буквы, пробел и дефис."
-        )
+        await messages.for_update(update)['last_name_invalid'].send(update.message)
         return LAST_NAME
     
     context.user_data['last_name'] = last_name
-    await update.message.reply_text(
-        "Введите ваше отчество.\n"
-        "Используйте только русские буквы, пробел и дефис."
-    )
+    await messages.for_update(update)['patronymic'].send(update.message)
     return PATRONYMIC
 
 async def process_patronymic(update: Update, context):
     patronymic = update.message.text
     
     if not validate_name(patronymic):
-        await update.message.reply_text(
-            "Неверный формат отчества. Используйте только русские буквы, пробел и дефис."
-        )
+        await messages.for_update(update)['patronymic_invalid'].send(update.message)
         return PATRONYMIC
     
     context.user_data['patronymic'] = patronymic
-    await update.message.reply_text(
-        "Введите ваш номер телефона.\n"
-        "Например: +79999999999 или 89999999999"
-    )
+    await messages.for_update(update)['phone_number'].send(update.message)
     return PHONE_NUMBER
 
 async def process_phone_number(update: Update, context):
@@ -276,191 +185,81 @@ async def process_phone_number(update: Update, context):
     
     is_valid, formatted_number = validate_phone(phone)
     if not is_valid:
-        progress = generate_progress_bar(STEPS[PHONE_NUMBER])
-        await update.message.reply_text(
-            f"{progress}"
-            "Неверный формат номера телефона.\n"
-            "Примеры правильного формата:\n"
-            "+79999999999\n"
-            "89999999999\n"
-            "9999999999\n"
-            "+12345678901 (международный формат)\n\n"
-            "Номер должен содержать от 10 до 15 цифр.",
-            parse_mode='HTML'
-        )
+        await messages.for_update(update)['phone_number_invalid'].send(update.message)
+        return PHONE_NUMBER
+
+    # Один человек - одна анкета: номер не должен быть занят другим аккаунтом
+    if await db.is_phone_registered_async(formatted_number, update.effective_user.id):
+        await messages.for_update(update)['phone_number_taken'].send(update.message)
         return PHONE_NUMBER
     
     context.user_data['phone_number'] = formatted_number
-    progress = generate_progress_bar(STEPS[MILITARY_SPEC])
-    await update.message.reply_text(
-        f"{progress}"
-        "Укажите номера ВУС и профессии через точку с запятой (;)\n\n"
-        "Примеры:\n"
-        "837, 166, 461; Плотник, Маляр, Крановщик - если несколько ВУС и профессий\n"
-        "837; Плотник - если одна ВУС и профессия\n"
-        "нет - если нет ВУС и профессии",
-        parse_mode='HTML'
-    )
+    await messages.for_update(update)['military_spec'].send(update.message)
     return MILITARY_SPEC
 
-def validate_military_spec(text):
-    # Если указано "нет", это валидное значение
-    if text.lower() == 'нет':
-        return True, 'нет'
-        
-    parts = text.split(';')
-    if len(parts) != 2:
-        return False, None
-        
-    vus_part, prof_part = parts
-    
-    # Обрабатываем ВУС
-    specs = []
-    for spec in vus_part.split(','):
-        # Извлекаем только цифры из каждой части
-        digits = ''.join(filter(str.isdigit, spec))
-        if digits:  # Если остались цифры
-            specs.append(digits)
-    
-    # Проверяем каждый ВУС на соответствие формату (3-4 цифры)
-    if not specs or not all(3 <= len(spec) <= 4 for spec in specs):
-        return False, None
-            
-    # Форматируем результат: ВУС + профессии
-    formatted_vus = ', '.join(sorted(specs))
-    formatted_prof = prof_part.strip()
-    
-    if not formatted_prof:  # Если профессия не указана
-        return False, None
-        
-    return True, f"{formatted_vus}; {formatted_prof}"
-
 async def process_military_spec(update: Update, context):
+    templates = messages.for_update(update)
     text = update.message.text.strip()
     is_valid, formatted_spec = validate_military_spec(text)
     
     if not is_valid:
-        progress = generate_progress_bar(STEPS[MILITARY_SPEC])
-        await update.message.reply_text(
-            f"{progress}"
-            "Неверный формат. Укажите номера ВУС и профессии через точку с запятой (;)\n\n"
-            "Примеры:\n"
-            "837, 166, 461; Плотник, Маляр, Крановщик - если несколько ВУС и профессий\n"
-            "837; Плотник - если одна ВУС и профессия\n"
-            "нет - если нет ВУС и профессии",
-            parse_mode='HTML'
-        )
+        await templates['military_spec_invalid'].send(update.message)
         return MILITARY_SPEC
     
     context.user_data['military_spec'] = formatted_spec
-    progress = generate_progress_bar(STEPS[DENTAL_SANATION])
-    await update.message.reply_text(
-        f"{progress}"
-        f"Есть ли у вас санация полости рта?",
-        reply_markup=get_yes_no_keyboard(),
-        parse_mode='HTML'
-    )
+    await templates['dental_sanation'].send(update.message)
     return DENTAL_SANATION
 
 async def process_dental_sanation(update: Update, context):
+    templates = messages.for_update(update)
     answer = update.message.text
-    if answer not in ['Да', 'Нет']:
-        progress = generate_progress_bar(STEPS[DENTAL_SANATION])
-        await update.message.reply_text(
-            f"{progress}"
-            "Пожалуйста, выберите 'Да' или 'Нет' на клавиатуре.",
-            reply_markup=get_yes_no_keyboard(),
-            parse_mode='HTML'
-        )
+    if answer not in templates.answers:
+        await templates['dental_sanation_invalid'].send(update.message)
         return DENTAL_SANATION
     
-    context.user_data['dental_sanation'] = (answer == 'Да')
-    progress = generate_progress_bar(STEPS[MEDICAL_CERTIFICATES])
-    await update.message.reply_text(
-        f"{progress}"
-        "Есть ли у вас справки ВИЧ/Сифилис/Гепатит?",
-        reply_markup=get_yes_no_keyboard(),
-        parse_mode='HTML'
-    )
+    context.user_data['dental_sanation'] = (answer == templates.yes)
+    await templates['medical_certificates'].send(update.message)
     return MEDICAL_CERTIFICATES
 
 async def process_medical_certificates(update: Update, context):
+    templates = messages.for_update(update)
     answer = update.message.text
-    if answer not in ['Да', 'Нет']:
-        progress = generate_progress_bar(STEPS[MEDICAL_CERTIFICATES])
-        await update.message.reply_text(
-            f"{progress}"
-            "Пожалуйста, выберите 'Да' или 'Нет' на клавиатуре.",
-            reply_markup=get_yes_no_keyboard(),
-            parse_mode='HTML'
-        )
+    if answer not in templates.answers:
+        await templates['medical_certificates_invalid'].send(update.message)
         return MEDICAL_CERTIFICATES
     
-    context.user_data['medical_certificates'] = (answer == 'Да')
-    progress = generate_progress_bar(STEPS[FOREIGN_PASSPORT])
-    await update.message.reply_text(
-        f"{progress}"
-        "Есть ли у вас загранпаспорт?",
-        reply_markup=get_yes_no_keyboard(),
-        parse_mode='HTML'
-    )
+    context.user_data['medical_certificates'] = (answer == templates.yes)
+    await templates['foreign_passport'].send(update.message)
     return FOREIGN_PASSPORT
 
 async def process_foreign_passport(update: Update, context):
+    templates = messages.for_update(update)
     answer = update.message.text
-    if answer not in ['Да', 'Нет']:
-        progress = generate_progress_bar(STEPS[FOREIGN_PASSPORT])
-        await update.message.reply_text(
-            f"{progress}"
-            "Пожалуйста, выберите 'Да' или 'Нет' на клавиатуре.",
-            reply_markup=get_yes_no_keyboard(),
-            parse_mode='HTML'
-        )
+    if answer not in templates.answers:
+        await templates['foreign_passport_invalid'].send(update.message)
         return FOREIGN_PASSPORT
     
-    context.user_data['foreign_passport'] = (answer == 'Да')
-    progress = generate_progress_bar(STEPS[ACTIVE_CONTRACTS])
-    await update.message.reply_text(
-        f"{progress}"
-        "Есть ли у вас действующие контракты с силовыми ведомствами?",
-        reply_markup=get_yes_no_keyboard(),
-        parse_mode='HTML'
-    )
+    context.user_data['foreign_passport'] = (answer == templates.yes)
+    await templates['active_contracts'].send(update.message)
     return ACTIVE_CONTRACTS
 
 async def process_active_contracts(update: Update, context):
+    templates = messages.for_update(update)
     answer = update.message.text
-    if answer not in ['Да', 'Нет']:
-        progress = generate_progress_bar(STEPS[ACTIVE_CONTRACTS])
-        await update.message.reply_text(
-            f"{progress}"
-            "Пожалуйста, выберите 'Да' или 'Нет' на клавиатуре.",
-            reply_markup=get_yes_no_keyboard(),
-            parse_mode='HTML'
-        )
+    if answer not in templates.answers:
+        await templates['active_contracts_invalid'].send(update.message)
         return ACTIVE_CONTRACTS
     
-    context.user_data['active_contracts'] = (answer == 'Да')
+    context.user_data['active_contracts'] = (answer == templates.yes)
     
     try:
-        db.add_user(update.effective_user.id, context.user_data)
-        await update.message.reply_text(
-            "Спасибо! Ваши данные успешно сохранены.\n"
-            "Если вам нужно заполнить анкету повторно, используйте команду /start",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        await db.add_user_async(update.effective_user.id, context.user_data)
+        await templates['saved'].send(update.message)
     except sqlite3.IntegrityError:
-        await update.message.reply_text(
-            "Вы уже регистрировались ранее.\n"
-            "Если нужно обновить данные, обратитесь к администратору.",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        await templates['already_registered'].send(update.message)
     except Exception as e:
-        await update.message.reply_text(
-            "Произошла ошибка при сохранении данных. Пожалуйста, попробуйте позже.",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        print(f"Error saving user data: {str(e)}")  # Логируем ошибку
+        await templates['save_error'].send(update.message)
+        logger.exception("Error saving user data: %s", e)
     
     return ConversationHandler.END
 
@@ -468,43 +267,31 @@ async def cancel(update: Update, context):
     user = update.message.from_user
     context.user_data.clear()  # Очищаем данные пользователя
     
-    await update.message.reply_text(
-        f"Регистрация отменена. Все введённые данные удалены.\n"
-        f"Чтобы начать регистрацию заново, используйте команду /start",
-        reply_markup=ReplyKeyboardRemove()
-    )
+    await messages.for_update(update)['cancelled'].send(update.message)
     return ConversationHandler.END
 
 async def process_message(update: Update, context):
     user_id = update.effective_user.id
-    current_time = time.time()
     
     # Проверяем, не заблокирован ли пользователь
-    if user_id in BLOCKED_USERS:
+    if shared_state.is_blocked(user_id):
         return
     
-    # Очищаем старые попытки (старше часа)
-    KEY_ATTEMPTS[user_id] = [t for t in KEY_ATTEMPTS[user_id] if current_time - t < BLOCK_TIME]
-    
     # Если слишком много попыток - блокируем
-    if len(KEY_ATTEMPTS[user_id]) >= MAX_KEY_ATTEMPTS:
-        BLOCKED_USERS.add(user_id)
-        db.ban_user(user_id)  # Баним пользователя в БД
-        await update.message.reply_text("Доступ заблокирован из-за превышения лимита попыток.")
+    if shared_state.check_key_attempts(user_id) == abuse.BAN:
+        await db.ban_user_async(user_id)  # Баним пользователя в БД
+        await messages.for_update(update)['key_attempts_blocked'].send(update.message)
         return
     
     # Проверяем ключ
     if update.message.text == os.getenv('ADMIN_KEY'):
-        ADMIN_USERS.add(user_id)  # Добавляем пользователя в множество админов
-        await update.message.reply_text(
-            "Выберите период для отчета:",
-            reply_markup=get_report_period_keyboard()
-        )
+        shared_state.add_admin(user_id)  # Добавляем пользователя в множество админов
+        await messages.for_update(update)['choose_report_period'].send(update.message)
         return
     
     # Если ключ неверный - записываем попытку
     if len(update.message.text) > 20:  # Если похоже на попытку ввода ключа
-        KEY_ATTEMPTS[user_id].append(current_time)
+        shared_state.record_key_attempt(user_id)
 
 async def process_report_callback(update: Update, context):
     query = update.callback_query
@@ -512,35 +299,196 @@ async def process_report_callback(update: Update, context):
     
     # Если есть кнопки - значит ключ был введен правильно
     # Просто генерируем и отправляем отчет
-    period = query.data.split('_')[1]
+    # report_<период> или report_<период>_<код ВУС>
+    _, period, *vus = query.data.split('_')
+    vus = vus[0] if vus else None
     try:
-        filename = utils.generate_excel_report(db, period)
-        await query.message.reply_document(
-            document=open(filename, 'rb'),
-            filename=filename
+        # Повторный запрос без новых регистраций отдается из кэша,
+        # одновременные запросы одного периода ждут одну сборку.
+        # Большой отчет приходит несколькими файлами, каждый - как только готов
+        async for filename, content in report_cache.parts(period, vus):
+            # Отчет уходит в очередь отправки после ответов анкеты
+            outbox.reply_document(
+                query.message,
+                document=content,
+                filename=filename
+            )
+    except Exception as e:
+        await messages.for_update(update).report_error(e).send(query.message)
+
+async def show_stats(update: Update, context):
+    # Сводка для админов из сводных таблиц, без выгрузки отчета.
+    # /stats 837 - сводка только по коду ВУС
+    templates = messages.for_update(update)
+    if not shared_state.is_admin(update.effective_user.id):
+        await templates['access_denied'].send(update.message)
+        return
+    vus = context.args[0] if context.args else None
+    if vus is not None and not validate_vus_code(vus):
+        await templates['vus_invalid'].send(update.message)
+        return
+    await templates.stats(await db.get_stats_async(vus), vus).send(update.message)
+
+async def report(update: Update, context):
+    # /report - выбор периода отчета, /report 837 - отчет только по коду ВУС
+    templates = messages.for_update(update)
+    if not shared_state.is_admin(update.effective_user.id):
+        await templates['access_denied'].send(update.message)
+        return
+    vus = context.args[0] if context.args else None
+    if vus is not None and not validate_vus_code(vus):
+        await templates['vus_invalid'].send(update.message)
+        return
+    await templates.choose_report_period(vus).send(update.message)
+
+def parse_export_period(args):
+    # "/export 01.01.2024 31.12.2024" -> (начальная дата, конечная дата) или None
+    if len(args) != 2:
+        return None
+    try:
+        start, end = (datetime.strptime(arg, '%d.%m.%Y') for arg in args)
+    except ValueError:
+        return None
+    if end < start:
+        return None
+    return start, end
+
+async def export(update: Update, context):
+    # Выгрузка за произвольный период в .csv.gz, собирается в пуле отчетов
+    templates = messages.for_update(update)
+    if not shared_state.is_admin(update.effective_user.id):
+        await templates['access_denied'].send(update.message)
+        return
+    period = parse_export_period(context.args)
+    if period is None:
+        await templates['export_usage'].send(update.message)
+        return
+
+    # Конечная дата входит в период целиком
+    start, end = period
+    try:
+        content = await asyncio.get_running_loop().run_in_executor(
+            report_pool, utils.build_export, db.path,
+            int(start.timestamp()), int((end + timedelta(days=1)).timestamp())
+        )
+        outbox.reply_document(
+            update.message,
+            document=content,
+            filename=f'export_{start:%Y%m%d}_{end:%Y%m%d}.csv.gz'
         )
-        os.remove(filename)  # Удаляем файл после отправки
     except Exception as e:
-        await query.message.reply_text(f"Ошибка при создании отчета: {str(e)}")
-
-def cleanup_temp_data():
-    current_time = time.time()
-    # Очистка старых попыток ввода ключа
-    for user_id in list(KEY_ATTEMPTS.keys()):
-        KEY_ATTEMPTS[user_id] = [t for t in KEY_ATTEMPTS[user_id] if current_time - t < BLOCK_TIME]
-        if not KEY_ATTEMPTS[user_id]:
-            del KEY_ATTEMPTS[user_id]
-    
-    # Очистка счетчиков спама
-    for user_id in list(SPAM_COUNTER.keys()):
-        if current_time - RATE_LIMIT.get(user_id, 0) > SPAM_RESET_TIME:
-            del SPAM_COUNTER[user_id]
-            
+        await templates.report_error(e).send(update.message)
+
+async def find(update: Update, context):
+    # Поиск кандидата по ФИО, телефону или ВУС
+    templates = messages.for_update(update)
+    if not shared_state.is_admin(update.effective_user.id):
+        await templates['access_denied'].send(update.message)
+        return
+    text = ' '.join(context.args)
+    # Лишняя строка показывает, есть ли следующая страница
+    rows = await db.search_users_async(text, FIND_PAGE_SIZE + 1)
+    if rows is None:
+        await templates['find_usage'].send(update.message)
+        return
+    if not rows:
+        await templates['find_empty'].send(update.message)
+        return
+    # Запрос запоминаем для кнопок листания: в callback_data он может не поместиться
+    context.user_data['find_query'] = text
+    await templates.find_results(rows, 0, FIND_PAGE_SIZE).send(update.message)
+
+async def process_find_callback(update: Update, context):
+    query = update.callback_query
+    await query.answer()
+    text = context.user_data.get('find_query')
+    if text is None or not shared_state.is_admin(update.effective_user.id):
+        return
+
+    page = int(query.data.split('_')[1])
+    rows = await db.search_users_async(text, FIND_PAGE_SIZE + 1, page * FIND_PAGE_SIZE)
+    if rows:
+        await messages.for_update(update).find_results(rows, page, FIND_PAGE_SIZE).edit(query.message)
+
+async def cleanup_temp_data(context):
+    start = time.perf_counter()
+    # Очистка истекших счетчиков, попыток ввода ключа и блокировок,
+    # а также простаивающих чатов очереди отправки
+    evicted = shared_state.sweep() + outbox.sweep()
     # Очистка старых отчетов
-    utils.cleanup_old_reports()
+    removed = utils.cleanup_old_reports()
+    logger.info(
+        "Cleanup: evicted %d entries, removed %d reports in %.2f ms",
+        evicted, removed, (time.perf_counter() - start) * 1000
+    )
+    stats = update_processor.snapshot()
+    logger.info(
+        "Updates: queue depth %d, in flight %d, wait p50 %.1f ms, p95 %.1f ms",
+        stats['queue_depth'], stats['in_flight'],
+        stats['wait_p50'] * 1000, stats['wait_p95'] * 1000
+    )
 
-def main():
-    application = Application.builder().token(os.getenv('BOT_TOKEN')).build()
+class InstrumentedRequest(HTTPXRequest):
+    # Транспорт PTB, который меряет время каждого запроса к Bot API
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._series = {}  # url -> серия метода; методов Bot API немного
+
+    async def do_request(self, url, method, *args, **kwargs):
+        series = self._series.get(url)
+        if series is None:
+            series = self._series[url] = metrics.TELEGRAM_SECONDS.labels(url.rsplit('/', 1)[-1])
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            series.observe(time.perf_counter() - started)
+
+async def start_metrics(application):
+    global metrics_server
+    if metrics.METRICS_PORT:
+        server = metrics.MetricsServer(port=metrics.METRICS_PORT)
+        try:
+            await server.start()
+        except OSError as e:
+            # Занятый порт не должен мешать боту работать, просто без /metrics
+            logger.error("Metrics server not started on port %s: %s", metrics.METRICS_PORT, e)
+            return
+        metrics_server = server
+
+async def drain_queues(application):
+    # Перед остановкой записываем отложенные регистрации (групповой commit)
+    # и отправляем то, что уже стоит в очереди ответов
+    if loaded(db) is not None:
+        await db.flush_pending()
+    await outbox.join()
+
+async def shutdown_resources(application):
+    # Последний шаг остановки: сервер метрик и процессы пула отчетов
+    if metrics_server is not None:
+        await metrics_server.stop()
+    # Пул, к которому не обращались, не создаем только ради остановки
+    if loaded(report_pool) is not None:
+        report_pool.shutdown()
+
+def build_application():
+    # Состояния анкет и черновики user_data переживают перезапуск бота
+    builder = (
+        Application.builder()
+        .token(os.getenv('BOT_TOKEN'))
+        .persistence(SQLitePersistence())
+        # Разные пользователи обслуживаются параллельно, один пользователь - по порядку
+        .concurrent_updates(update_processor)
+        # Пул соединений как у PTB по умолчанию, плюс замер времени запросов
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(start_metrics)
+        .post_stop(drain_queues)
+        .post_shutdown(shutdown_resources)
+    )
+    # Свой сервер Bot API (локальный telegram-bot-api или стенд нагрузочного теста)
+    if os.getenv('BOT_API_URL'):
+        builder.base_url(os.getenv('BOT_API_URL'))
+    application = builder.build()
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
@@ -595,15 +543,60 @@ def main():
             ],
         },
         fallbacks=[],
-        allow_reentry=True
+        allow_reentry=True,
+        name='registration',
+        persistent=True
     )
 
+    # Время каждого обработчика пишется в метрики с именем состояния анкеты
+    for handler in conv_handler.entry_points:
+        handler.callback = metrics.timed_handler(handler.callback, 'ENTRY')
+    for state, handlers in conv_handler.states.items():
+        for handler in handlers:
+            handler.callback = metrics.timed_handler(handler.callback, STATE_NAMES[state])
+
     # Добавляем обработчики
     application.add_handler(conv_handler)
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_message))
-    application.add_handler(CallbackQueryHandler(process_report_callback, pattern='^report_'))
+    application.add_handler(CommandHandler('stats', metrics.timed_handler(show_stats, 'NONE')))
+    application.add_handler(CommandHandler('report', metrics.timed_handler(report, 'NONE')))
+    application.add_handler(CommandHandler('export', metrics.timed_handler(export, 'NONE')))
+    application.add_handler(CommandHandler('find', metrics.timed_handler(find, 'NONE')))
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND, metrics.timed_handler(process_message, 'NONE')
+    ))
+    application.add_handler(CallbackQueryHandler(
+        metrics.timed_handler(process_report_callback, 'NONE'), pattern='^report_'
+    ))
+    application.add_handler(CallbackQueryHandler(
+        metrics.timed_handler(process_find_callback, 'NONE'), pattern='^find_'
+    ))
+
+    # Периодическая очистка: каждый проход трогает только истекшие записи
+    utils.scan_leftover_reports()
+    application.job_queue.run_repeating(
+        cleanup_temp_data, interval=CLEANUP_INTERVAL, first=CLEANUP_INTERVAL
+    )
+
+    return application
 
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+def main():
+    # Режим работы выбирается переменной окружения BOT_MODE: polling или webhook
+    webhook_mode = os.getenv('BOT_MODE', 'polling') == 'webhook'
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_mode and not webhook_url:
+        raise SystemExit("BOT_MODE=webhook requires WEBHOOK_URL (public HTTPS address of the bot)")
+
+    application = build_application()
+    if webhook_mode:
+        import webhook
+        asyncio.run(webhook.run_webhook(
+            application,
+            webhook_url=webhook_url,
+            secret_token=os.getenv('WEBHOOK_SECRET'),
+            allowed_updates=Update.ALL_TYPES
+        ))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
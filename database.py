@@ -1,81 +1,777 @@
+import asyncio
+import queue
+from array import array
+from bisect import bisect_left
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import metrics
+from validation import date_key, phone_key
+
+DB_PATH = 'users.db'
+READ_POOL_SIZE = 4  # Количество читающих соединений в пуле
+SCHEMA_VERSION = 7  # Текущая версия схемы, хранится в PRAGMA user_version
+GROUP_COMMIT_INTERVAL = 0.02  # Сколько секунд копим регистрации перед записью
+GROUP_COMMIT_MAX_ROWS = 200  # Максимум строк в одной транзакции
+RECENT_LOG_SIZE = 500  # Сколько последних регистраций помним для инкрементальных отчетов
+STATS_PERIODS = (('day', 1), ('week', 7), ('month', 30))  # Период /stats -> число дней
+STATS_TOP_VUS = 10  # Сколько ВУС показывать в /stats
+SEARCH_MIN_PREFIX = 2  # Минимальная длина слова в /find
+SEARCH_MAX_TERMS = 5  # Сколько слов запроса учитывается
+BOOLEAN_FIELDS = ('dental_sanation', 'medical_certificates', 'foreign_passport', 'active_contracts')
+
+DB_SECONDS = metrics.Histogram('bot_db_seconds', 'Время методов Database', ('method',))
+
+def encode_birth_date(value):
+    # "ДД.ММ.ГГГГ" -> целое ГГГГММДД: компактно и сортируется как дата
+    return date_key(datetime.strptime(value, '%d.%m.%Y'))
+
+def decode_birth_date(value):
+    if value is None:
+        return None
+    return f"{value % 100:02d}.{value // 100 % 100:02d}.{value // 10000:04d}"
+
+def to_timestamp(value):
+    return int(value.timestamp())
+
+def from_timestamp(value):
+    return datetime.fromtimestamp(value)
+
+# Миграции схемы: (версия, функция). Каждая выполняется в своей транзакции,
+# после чего номер версии записывается в PRAGMA user_version.
+
+def _migration_1_legacy(conn):
+    # Исходная схема бота: даты строками, булевы значения без ограничений
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        birth_date TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        patronymic TEXT,
+        phone_number TEXT,
+        military_spec TEXT,
+        dental_sanation BOOLEAN,
+        medical_certificates BOOLEAN,
+        foreign_passport BOOLEAN,
+        active_contracts BOOLEAN,
+        registration_date TIMESTAMP,
+        is_banned BOOLEAN DEFAULT FALSE
+    )
+    ''')
+
+def _legacy_birth_date(user_id, value):
+    # Старый бот проверял дату через strptime('%d.%m.%Y') и сохранял текст
+    # как есть, поэтому встречаются и '1.2.1990'. Разбираем тем же strptime;
+    # нераспознанная дата прерывает миграцию, а не теряется
+    if value is None:
+        return None
+    try:
+        return encode_birth_date(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid birth_date {value!r} for user {user_id}") from None
+
+def _migration_2_typed(conn):
+    # Типизированная схема: даты целыми числами, флаги строго 0/1,
+    # индекс по дате регистрации для отчетов за период
+    conn.execute('''
+    CREATE TABLE users_v2 (
+        user_id INTEGER PRIMARY KEY,
+        birth_date INTEGER,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        patronymic TEXT NOT NULL,
+        phone_number TEXT NOT NULL,
+        military_spec TEXT NOT NULL,
+        dental_sanation INTEGER NOT NULL CHECK (dental_sanation IN (0, 1)),
+        medical_certificates INTEGER NOT NULL CHECK (medical_certificates IN (0, 1)),
+        foreign_passport INTEGER NOT NULL CHECK (foreign_passport IN (0, 1)),
+        active_contracts INTEGER NOT NULL CHECK (active_contracts IN (0, 1)),
+        registration_date INTEGER NOT NULL,
+        is_banned INTEGER NOT NULL DEFAULT 0 CHECK (is_banned IN (0, 1))
+    )
+    ''')
+    # Старые даты регистрации записаны в локальном времени, модификатор
+    # 'utc' переводит их в UTC перед получением unix-времени
+    cursor = conn.execute('''
+    SELECT
+        user_id, birth_date,
+        first_name, last_name, patronymic, phone_number, military_spec,
+        COALESCE(dental_sanation, 0) != 0,
+        COALESCE(medical_certificates, 0) != 0,
+        COALESCE(foreign_passport, 0) != 0,
+        COALESCE(active_contracts, 0) != 0,
+        CAST(strftime('%s', registration_date, 'utc') AS INTEGER),
+        COALESCE(is_banned, 0) != 0
+    FROM users
+    ''')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        conn.executemany(
+            'INSERT INTO users_v2 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(user_id, _legacy_birth_date(user_id, birth_date), *rest)
+             for user_id, birth_date, *rest in rows]
+        )
+    conn.execute('DROP TABLE users')
+    conn.execute('ALTER TABLE users_v2 RENAME TO users')
+    conn.execute('CREATE INDEX idx_users_registration_date ON users (registration_date)')
+
+def _migration_3_stats(conn):
+    # Сводные таблицы для /stats: регистрации и ответы "Да" по дням,
+    # регистрации по ВУС по дням. День - локальная дата ГГГГММДД.
+    conn.execute('''
+    CREATE TABLE daily_stats (
+        day INTEGER PRIMARY KEY,
+        registrations INTEGER NOT NULL,
+        dental_sanation INTEGER NOT NULL,
+        medical_certificates INTEGER NOT NULL,
+        foreign_passport INTEGER NOT NULL,
+        active_contracts INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE daily_vus_stats (
+        day INTEGER NOT NULL,
+        code TEXT NOT NULL,
+        registrations INTEGER NOT NULL,
+        PRIMARY KEY (day, code)
+    ) WITHOUT ROWID
+    ''')
+    # Заполняем по уже зарегистрированным пользователям, пачками
+    cursor = conn.execute('''
+    SELECT military_spec, dental_sanation, medical_certificates,
+        foreign_passport, active_contracts, registration_date
+    FROM users
+    ''')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        update_stats(conn, rows)
+
+# Поля поиска /find. В индекс попадают с заменой Ё на Е: токенизатор
+# unicode61 не считает их одной буквой, а в анкетах пишут по-разному
+SEARCH_FIELDS = ('last_name', 'first_name', 'patronymic', 'phone_number', 'military_spec')
+
+def _search_values(prefix, aliases=False):
+    return ', '.join(
+        f"replace(replace({prefix}{field}, 'ё', 'е'), 'Ё', 'Е')" + (f' AS {field}' if aliases else '')
+        for field in SEARCH_FIELDS
+    )
+
+def _migration_4_search(conn):
+    # Полнотекстовый индекс FTS5 для /find. Сам текст в индексе не хранится:
+    # содержимое берется из представления над users (external content),
+    # индекс поддерживают триггеры. prefix='2 3' ускоряет поиск по началу слова.
+    fields = ', '.join(SEARCH_FIELDS)
+    conn.execute(f'''
+    CREATE VIEW users_search AS
+    SELECT user_id, {_search_values('', aliases=True)} FROM users
+    ''')
+    conn.execute(f'''
+    CREATE VIRTUAL TABLE users_fts USING fts5(
+        {fields},
+        content='users_search', content_rowid='user_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts (rowid, {fields})
+        VALUES (new.user_id, {_search_values('new.')});
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, {fields})
+        VALUES ('delete', old.user_id, {_search_values('old.')});
+    END
+    ''')
+    # Бан меняет только is_banned, индекс при этом не трогаем
+    conn.execute(f'''
+    CREATE TRIGGER users_fts_update AFTER UPDATE OF user_id, {fields} ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, {fields})
+        VALUES ('delete', old.user_id, {_search_values('old.')});
+        INSERT INTO users_fts (rowid, {fields})
+        VALUES (new.user_id, {_search_values('new.')});
+    END
+    ''')
+    conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+def _migration_5_phone_key(conn):
+    # Нормализованный номер телефона с индексом: проверка дубликата при
+    # регистрации - один поиск по индексу. Индекс не уникальный, потому что
+    # дубликаты уже есть; их находит duplicates.py
+    conn.execute('ALTER TABLE users ADD COLUMN phone_key INTEGER')
+    cursor = conn.execute('SELECT user_id, phone_number FROM users')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        conn.executemany(
+            'UPDATE users SET phone_key = ? WHERE user_id = ?',
+            [(phone_key(phone), user_id) for user_id, phone in rows]
+        )
+    conn.execute('CREATE INDEX idx_users_phone_key ON users (phone_key)')
+
+def _migration_6_user_vus(conn):
+    # Коды ВУС отдельными строками: фильтр отчетов и /stats по коду идет
+    # по индексу, а не через LIKE по military_spec
+    conn.execute('''
+    CREATE TABLE user_vus (
+        user_id INTEGER NOT NULL,
+        code TEXT NOT NULL,
+        PRIMARY KEY (user_id, code)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX idx_user_vus_code ON user_vus (code, user_id)')
+    conn.execute('''
+    CREATE TRIGGER user_vus_delete AFTER DELETE ON users BEGIN
+        DELETE FROM user_vus WHERE user_id = old.user_id;
+    END
+    ''')
+    cursor = conn.execute('SELECT user_id, military_spec FROM users')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        conn.executemany(
+            'INSERT OR IGNORE INTO user_vus (user_id, code) VALUES (?, ?)',
+            [(user_id, code) for user_id, military_spec in rows for code in vus_codes(military_spec)]
+        )
+
+def _migration_7_user_vus_dates(conn):
+    # Дата регистрации в user_vus: выборка по коду за период идет по индексу
+    # (code, registration_date, user_id) сразу в порядке отчета, без чтения
+    # и сортировки всех анкет с этим кодом. Дата регистрации анкеты не меняется,
+    # поэтому копия не расходится с users
+    conn.execute('DROP TRIGGER user_vus_delete')
+    conn.execute('''
+    CREATE TABLE user_vus_v7 (
+        user_id INTEGER NOT NULL,
+        code TEXT NOT NULL,
+        registration_date INTEGER NOT NULL,
+        PRIMARY KEY (user_id, code)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    INSERT INTO user_vus_v7
+    SELECT v.user_id, v.code, u.registration_date
+    FROM user_vus v JOIN users u ON u.user_id = v.user_id
+    ''')
+    conn.execute('DROP TABLE user_vus')
+    conn.execute('ALTER TABLE user_vus_v7 RENAME TO user_vus')
+    conn.execute(
+        'CREATE INDEX idx_user_vus_code ON user_vus (code, registration_date, user_id)'
+    )
+    conn.execute('''
+    CREATE TRIGGER user_vus_delete AFTER DELETE ON users BEGIN
+        DELETE FROM user_vus WHERE user_id = old.user_id;
+    END
+    ''')
+
+MIGRATIONS = [
+    (1, _migration_1_legacy),
+    (2, _migration_2_typed),
+    (3, _migration_3_stats),
+    (4, _migration_4_search),
+    (5, _migration_5_phone_key),
+    (6, _migration_6_user_vus),
+    (7, _migration_7_user_vus_dates),
+]
+
+def vus_codes(military_spec):
+    # "837, 166; Плотник" -> ['837', '166']; для "нет" список пуст
+    if ';' not in military_spec:
+        return []
+    vus_part = military_spec.split(';', 1)[0]
+    return [code.strip() for code in vus_part.split(',') if code.strip()]
+
+def update_stats(conn, rows):
+    # Добавляет новые регистрации в сводные таблицы. rows - кортежи
+    # (military_spec, 4 флага, registration_date); вызывается в той же
+    # транзакции, что и INSERT в users
+    days = {}
+    vus = {}
+    for military_spec, *flags, registered in rows:
+        day = date_key(datetime.fromtimestamp(registered))
+        totals = days.get(day)
+        if totals is None:
+            totals = days[day] = [0, 0, 0, 0, 0]
+        totals[0] += 1
+        for i, flag in enumerate(flags, start=1):
+            totals[i] += flag
+        for code in vus_codes(military_spec):
+            vus[day, code] = vus.get((day, code), 0) + 1
+
+    conn.executemany('''
+    INSERT INTO daily_stats VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (day) DO UPDATE SET
+        registrations = registrations + excluded.registrations,
+        dental_sanation = dental_sanation + excluded.dental_sanation,
+        medical_certificates = medical_certificates + excluded.medical_certificates,
+        foreign_passport = foreign_passport + excluded.foreign_passport,
+        active_contracts = active_contracts + excluded.active_contracts
+    ''', [(day, *totals) for day, totals in days.items()])
+    conn.executemany('''
+    INSERT INTO daily_vus_stats VALUES (?, ?, ?)
+    ON CONFLICT (day, code) DO UPDATE SET
+        registrations = registrations + excluded.registrations
+    ''', [(day, code, count) for (day, code), count in vus.items()])
+
+def insert_user_vus(conn, rows):
+    # rows - кортежи (user_id, military_spec, registration_date)
+    conn.executemany(
+        'INSERT OR IGNORE INTO user_vus (user_id, code, registration_date) VALUES (?, ?, ?)',
+        [
+            (user_id, code, registered)
+            for user_id, military_spec, registered in rows
+            for code in vus_codes(military_spec)
+        ]
+    )
+
+def record_new_users(conn, params):
+    # Всё, что обновляется вместе с вставкой в users: сводные таблицы /stats
+    # и коды ВУС. params - параметры INSERT INTO users уже вставленных строк,
+    # вызывается в той же транзакции
+    update_stats(conn, [(p[6], p[7], p[8], p[9], p[10], p[11]) for p in params])
+    insert_user_vus(conn, [(p[0], p[6], p[11]) for p in params])
+
+def _search_term(word):
+    # Номера в индексе хранятся как +7..., то есть токеном 7999...:
+    # набранный полностью номер (89991112234) приводим к тому же виду
+    if word.isdigit():
+        key = phone_key(word)
+        if key is not None:
+            return str(key)
+    return word
+
+def search_query(text):
+    # Запрос пользователя -> выражение FTS5: каждое слово ищется по началу,
+    # все слова должны найтись. Спецсимволы FTS5 в запрос не попадают.
+    words = ''.join(ch if ch.isalnum() else ' ' for ch in text.replace('ё', 'е').replace('Ё', 'Е'))
+    terms = [_search_term(word) for word in words.split() if len(word) >= SEARCH_MIN_PREFIX]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms[:SEARCH_MAX_TERMS])
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn, target=SCHEMA_VERSION):
+    version = get_schema_version(conn)
+    for migration_version, migration in MIGRATIONS:
+        if migration_version <= version or migration_version > target:
+            continue
+        try:
+            conn.execute('BEGIN')
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {migration_version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = migration_version
+    return version
+
+class SortedIdSet:
+    # Компактное множество id: отсортированный массив int64 (8 байт на id)
+    # с двоичным поиском вместо set с объектом int на каждый элемент
+    def __init__(self, ids=()):
+        self._ids = array('q', sorted(ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        ids = self._ids
+        i = bisect_left(ids, user_id)
+        return i < len(ids) and ids[i] == user_id
+
+    def add(self, user_id):
+        ids = self._ids
+        i = bisect_left(ids, user_id)
+        if i == len(ids) or ids[i] != user_id:
+            ids.insert(i, user_id)
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('users.db', check_same_thread=False)
+    def __init__(self, path=DB_PATH, pool_size=READ_POOL_SIZE,
+                 commit_interval=GROUP_COMMIT_INTERVAL, commit_max_rows=GROUP_COMMIT_MAX_ROWS):
+        self.path = path
+        # Одно пишущее соединение: SQLite всё равно сериализует запись,
+        # а в режиме WAL читатели не ждут писателя
+        self.conn = self._connect()
+        self._write_lock = threading.Lock()
+        # Версия данных растет при каждой регистрации; по ней кэш отчетов
+        # понимает, устарел ли он и какие строки добавились
+        self.data_version = 0
+        self._recent_users = deque(maxlen=RECENT_LOG_SIZE)
         self.create_tables()
+        self._sqlite_data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+        # Кэш забаненных и зарегистрированных пользователей: заполняется
+        # при запуске и обновляется при записи в ban_user и add_user
+        self._banned = SortedIdSet()
+        self._registered = SortedIdSet()
+        self.warm_cache()
+
+        self._readers = queue.Queue()
+        for _ in range(pool_size):
+            self._readers.put(self._connect())
+        self._pool_size = pool_size
+
+        # Отдельный пул потоков, чтобы запросы к диску не блокировали event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size + 1, thread_name_prefix='db'
+        )
+
+        # Очередь отложенной записи регистраций (групповой commit)
+        self.commit_interval = commit_interval
+        self.commit_max_rows = commit_max_rows
+        self._pending = []  # (параметры строки, future обработчика)
+        self._flush_timer = None
+        self._flushing = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @contextmanager
+    def reader(self):
+        # Берём свободное читающее соединение из пула и возвращаем его обратно
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            yield self.conn
+
+    def _check_external_writes(self):
+        # PRAGMA data_version меняется, когда в файл пишет другое соединение,
+        # например другой процесс-воркер. Таких изменений нет в журнале,
+        # поэтому просто поднимаем версию и очищаем журнал.
+        sqlite_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if sqlite_version != self._sqlite_data_version:
+            self._sqlite_data_version = sqlite_version
+            self.data_version += 1
+            self._recent_users.clear()
+
+    @DB_SECONDS.timed('changes_since')
+    def changes_since(self, version):
+        # Возвращает user_id, добавленные после указанной версии,
+        # или None, если журнал уже не покрывает этот промежуток
+        with self._write_lock:
+            self._check_external_writes()
+            if version == self.data_version:
+                return []
+            if not self._recent_users or self._recent_users[0][0] > version + 1:
+                return None
+            return [user_id for v, user_id in self._recent_users if v > version]
+
+    def _bump_version(self, user_id):
+        self.data_version += 1
+        self._recent_users.append((self.data_version, user_id))
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for _ in range(self._pool_size):
+            self._readers.get().close()
+        self.conn.close()
 
     def create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            birth_date TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            patronymic TEXT,
-            phone_number TEXT,
-            military_spec TEXT,
-            dental_sanation BOOLEAN,
-            medical_certificates BOOLEAN,
-            foreign_passport BOOLEAN,
-            active_contracts BOOLEAN,
-            registration_date TIMESTAMP,
-            is_banned BOOLEAN DEFAULT FALSE
+        # Создает таблицы новой БД и переводит старые файлы на текущую схему
+        with self.writer() as conn:
+            migrate(conn)
+
+    @DB_SECONDS.timed('warm_cache')
+    def warm_cache(self):
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id FROM users WHERE is_banned = 1')
+            self._banned = SortedIdSet(row[0] for row in cursor)
+            cursor.execute('SELECT user_id FROM users')
+            self._registered = SortedIdSet(row[0] for row in cursor)
+
+    def _user_params(self, user_id, data):
+        # Валидация данных перед вставкой
+        if not isinstance(user_id, int) or user_id <= 0:
+            raise ValueError("Invalid user_id")
+
+        required_fields = ['birth_date', 'first_name', 'last_name', 'patronymic',
+                          'phone_number', 'military_spec']
+        for field in required_fields:
+            if not isinstance(data.get(field), str):
+                raise ValueError(f"Invalid {field}")
+
+        boolean_fields = ['dental_sanation', 'medical_certificates',
+                         'foreign_passport', 'active_contracts']
+        for field in boolean_fields:
+            if not isinstance(data.get(field), bool):
+                raise ValueError(f"Invalid {field}")
+
+        return (
+            user_id, encode_birth_date(data['birth_date']), data['first_name'],
+            data['last_name'], data['patronymic'], data['phone_number'],
+            data['military_spec'], data['dental_sanation'],
+            data['medical_certificates'], data['foreign_passport'],
+            data['active_contracts'], int(time.time()), phone_key(data['phone_number'])
         )
-        ''')
-        self.conn.commit()
 
+    @DB_SECONDS.timed('_insert_users')
+    def _insert_users(self, rows):
+        # Вставляет пачку строк одной транзакцией (один fsync на всю пачку).
+        # Возвращает для каждой строки None или её ошибку: ошибка одного
+        # INSERT в SQLite не откатывает остальные строки транзакции.
+        results = []
+        with self.writer() as conn:
+            try:
+                cursor = conn.cursor()
+                for params in rows:
+                    try:
+                        # Используем параметризованный запрос для защиты от SQL-инъекций
+                        cursor.execute('''
+                        INSERT INTO users (
+                            user_id, birth_date, first_name, last_name, patronymic,
+                            phone_number, military_spec, dental_sanation, medical_certificates,
+                            foreign_passport, active_contracts, registration_date, phone_key
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', params)
+                        results.append(None)
+                    except sqlite3.IntegrityError as e:
+                        results.append(e)
+                record_new_users(
+                    conn, [params for params, result in zip(rows, results) if result is None]
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            for params, result in zip(rows, results):
+                if result is None:
+                    self._registered.add(params[0])
+                    self._bump_version(params[0])
+        return results
+
+    @DB_SECONDS.timed('get_stats')
+    def get_stats(self, today=None, top=STATS_TOP_VUS, vus=None):
+        # Сводка для /stats только из сводных таблиц: несколько десятков строк
+        # вместо просмотра users. Возвращает {период: (регистраций,
+        # {поле: доля ответов "Да"}, [(ВУС, регистраций), ...])}
+        today = today or datetime.now()
+        if vus is not None:
+            return self._get_vus_stats(today, vus)
+        stats = {}
+        with self.reader() as conn:
+            for period, days in STATS_PERIODS:
+                since = date_key(today - timedelta(days=days - 1))
+                totals = conn.execute('''
+                SELECT COALESCE(SUM(registrations), 0), SUM(dental_sanation),
+                    SUM(medical_certificates), SUM(foreign_passport), SUM(active_contracts)
+                FROM daily_stats WHERE day >= ?
+                ''', (since,)).fetchone()
+                count = totals[0]
+                shares = {
+                    field: (yes / count if count else 0.0)
+                    for field, yes in zip(BOOLEAN_FIELDS, totals[1:])
+                }
+                top_vus = conn.execute('''
+                SELECT code, SUM(registrations) AS total FROM daily_vus_stats
+                WHERE day >= ? GROUP BY code ORDER BY total DESC, code LIMIT ?
+                ''', (since, top)).fetchall()
+                stats[period] = (count, shares, top_vus)
+        return stats
+
+    def _get_vus_stats(self, today, vus):
+        # Сводка по одному коду ВУС: пользователи за период находятся по индексу
+        # user_vus, их строки - по первичному ключу users. Список ВУС пустой.
+        stats = {}
+        with self.reader() as conn:
+            for period, days in STATS_PERIODS:
+                since = (today - timedelta(days=days - 1)).replace(
+                    hour=0, minute=0, second=0, microsecond=0
+                )
+                totals = conn.execute('''
+                SELECT COUNT(*), SUM(u.dental_sanation), SUM(u.medical_certificates),
+                    SUM(u.foreign_passport), SUM(u.active_contracts)
+                FROM user_vus v JOIN users u ON u.user_id = v.user_id
+                WHERE v.code = ? AND v.registration_date >= ?
+                ''', (vus, to_timestamp(since))).fetchone()
+                count = totals[0]
+                shares = {
+                    field: (yes / count if count else 0.0)
+                    for field, yes in zip(BOOLEAN_FIELDS, totals[1:])
+                }
+                stats[period] = (count, shares, [])
+        return stats
+
+    @DB_SECONDS.timed('count_registrations')
+    def count_registrations(self, start_ts, vus=None):
+        # Число регистраций с начала периода: считается по индексу даты,
+        # с кодом ВУС - по индексу user_vus
+        with self.reader() as conn:
+            if vus is None:
+                return conn.execute(
+                    'SELECT COUNT(*) FROM users WHERE registration_date >= ?', (start_ts,)
+                ).fetchone()[0]
+            return conn.execute(
+                'SELECT COUNT(*) FROM user_vus WHERE code = ? AND registration_date >= ?',
+                (vus, start_ts)
+            ).fetchone()[0]
+
+    @DB_SECONDS.timed('search_users')
+    def search_users(self, text, limit, offset=0):
+        # Поиск для /find. Порядок - по убыванию user_id: его FTS5 отдает
+        # без сортировки всех совпадений. Возвращает строки
+        # (user_id, фамилия, имя, отчество, дата рождения, телефон, ВУС,
+        # дата регистрации) или None, если в запросе нет слов для поиска
+        query = search_query(text)
+        if query is None:
+            return None
+        with self.reader() as conn:
+            return conn.execute('''
+            SELECT u.user_id, u.last_name, u.first_name, u.patronymic, u.birth_date,
+                u.phone_number, u.military_spec, u.registration_date
+            FROM users_fts JOIN users u ON u.user_id = users_fts.rowid
+            WHERE users_fts MATCH ?
+            ORDER BY users_fts.rowid DESC
+            LIMIT ? OFFSET ?
+            ''', (query, limit, offset)).fetchall()
+
+    @DB_SECONDS.timed('is_phone_registered')
+    def is_phone_registered(self, phone, user_id):
+        # Зарегистрирован ли уже этот номер с другого аккаунта: один поиск по индексу,
+        # собственная запись user_id не в счет
+        key = phone_key(phone)
+        if key is None:
+            return False
+        with self.reader() as conn:
+            return conn.execute(
+                'SELECT 1 FROM users WHERE phone_key = ? AND user_id != ? LIMIT 1',
+                (key, user_id)
+            ).fetchone() is not None
+
+    @DB_SECONDS.timed('add_user')
     def add_user(self, user_id, data):
-        try:
-            # Валидация данных перед вставкой
-            if not isinstance(user_id, int) or user_id <= 0:
-                raise ValueError("Invalid user_id")
-            
-            required_fields = ['birth_date', 'first_name', 'last_name', 'patronymic', 
-                              'phone_number', 'military_spec']
-            for field in required_fields:
-                if not isinstance(data.get(field), str):
-                    raise ValueError(f"Invalid {field}")
-                
-            boolean_fields = ['dental_sanation', 'medical_certificates', 
-                             'foreign_passport', 'active_contracts']
-            for field in boolean_fields:
-                if not isinstance(data.get(field), bool):
-                    raise ValueError(f"Invalid {field}")
-            
-            cursor = self.conn.cursor()
-            # Используем параметризованный запрос для защиты от SQL-инъекций
-            cursor.execute('''
-            INSERT INTO users (
-                user_id, birth_date, first_name, last_name, patronymic,
-                phone_number, military_spec, dental_sanation, medical_certificates,
-                foreign_passport, active_contracts, registration_date
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id, data['birth_date'], data['first_name'], data['last_name'],
-                data['patronymic'], data['phone_number'], data['military_spec'],
-                data['dental_sanation'], data['medical_certificates'],
-                data['foreign_passport'], data['active_contracts'], datetime.now()
-            ))
-            self.conn.commit()
-        except Exception as e:
-            self.conn.rollback()
-            raise e
+        params = self._user_params(user_id, data)
+        error = self._insert_users([params])[0]
+        if error is not None:
+            raise error
 
+    @DB_SECONDS.timed('ban_user')
     def ban_user(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE users SET is_banned = TRUE WHERE user_id = ?', (user_id,))
-        self.conn.commit()
+        with self.writer() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET is_banned = 1 WHERE user_id = ?', (user_id,))
+            conn.commit()
+            # Как и в БД, бан действует только на зарегистрированных пользователей
+            if cursor.rowcount:
+                self._banned.add(user_id)
 
+    @DB_SECONDS.timed('is_user_banned')
     def is_user_banned(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT is_banned FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        return result[0] if result else False 
+        return user_id in self._banned
 
+    @DB_SECONDS.timed('get_user_attempts')
     def get_user_attempts(self, user_id):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM users WHERE user_id = ?', (user_id,))
-        return cursor.fetchone()[0] 
\ No newline at end of file
+        # user_id - первичный ключ, поэтому попыток может быть 0 или 1
+        return 1 if user_id in self._registered else 0
+
+    # Асинхронный API для обработчиков бота: запросы выполняются в пуле потоков.
+    # Синхронные методы выше оставлены для обратной совместимости и для утилит.
+
+    @DB_SECONDS.timed('add_user_async')
+    async def add_user_async(self, user_id, data):
+        # Данные проверяем сразу, а строку ставим в очередь групповой записи.
+        # Обработчик ждет, пока его строка не будет зафиксирована на диске.
+        params = self._user_params(user_id, data)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((params, future))
+
+        if len(self._pending) >= self.commit_max_rows:
+            self._start_flush()
+        elif self._flush_timer is None and not self._flushing:
+            self._flush_timer = loop.call_later(self.commit_interval, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._flushing or not self._pending:
+            return
+        self._flushing = True
+        batch = self._pending[:self.commit_max_rows]
+        self._pending = self._pending[self.commit_max_rows:]
+        asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch):
+        try:
+            results = await self._run(self._insert_users, [params for params, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._flushing = False
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result is None:
+                future.set_result(None)
+            else:
+                future.set_exception(result)
+
+        # Всё, что накопилось за время записи, уже подождало - пишем сразу
+        if self._pending:
+            self._start_flush()
+
+    async def flush_pending(self):
+        # Дожидается записи всех отложенных регистраций (например, при остановке)
+        while self._pending or self._flushing:
+            self._start_flush()
+            await asyncio.sleep(self.commit_interval)
+
+    @DB_SECONDS.timed('get_stats_async')
+    async def get_stats_async(self, vus=None):
+        return await self._run(self.get_stats, None, STATS_TOP_VUS, vus)
+
+    @DB_SECONDS.timed('count_registrations_async')
+    async def count_registrations_async(self, start_ts, vus=None):
+        return await self._run(self.count_registrations, start_ts, vus)
+
+    @DB_SECONDS.timed('search_users_async')
+    async def search_users_async(self, text, limit, offset=0):
+        return await self._run(self.search_users, text, limit, offset)
+
+    @DB_SECONDS.timed('is_phone_registered_async')
+    async def is_phone_registered_async(self, phone, user_id):
+        return await self._run(self.is_phone_registered, phone, user_id)
+
+    @DB_SECONDS.timed('ban_user_async')
+    async def ban_user_async(self, user_id):
+        return await self._run(self.ban_user, user_id)
+
+    @DB_SECONDS.timed('is_user_banned_async')
+    async def is_user_banned_async(self, user_id):
+        # Ответ берется из кэша в памяти, поток для диска не нужен
+        return self.is_user_banned(user_id)
+
+    @DB_SECONDS.timed('get_user_attempts_async')
+    async def get_user_attempts_async(self, user_id):
+        return self.get_user_attempts(user_id)
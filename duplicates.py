@@ -0,0 +1,78 @@
+# Поиск анкет с одинаковым номером телефона среди уже зарегистрированных.
+# Один проход по индексу phone_key: GROUP BY находит номера, встречающиеся
+# больше одного раза, затем строки этих номеров читаются уже упорядоченными
+# по номеру и группируются подряд идущими - без сравнения каждой анкеты
+# с каждой. Результат - CSV, одна строка на анкету, с номером группы.
+# Запуск: python duplicates.py --output duplicates.csv
+import argparse
+import csv
+import logging
+import sqlite3
+import time
+from itertools import groupby
+
+from database import DB_PATH, decode_birth_date, from_timestamp, migrate
+
+logger = logging.getLogger(__name__)
+
+DUPLICATES_QUERY = '''
+    SELECT u.phone_key, u.user_id, u.last_name, u.first_name, u.patronymic,
+        u.birth_date, u.phone_number, u.registration_date, u.is_banned
+    FROM (
+        SELECT phone_key FROM users
+        WHERE phone_key IS NOT NULL
+        GROUP BY phone_key HAVING COUNT(*) > 1
+    ) AS d
+    JOIN users u ON u.phone_key = d.phone_key
+    ORDER BY u.phone_key, u.registration_date
+    '''
+
+def find_duplicates(conn):
+    # Возвращает итератор групп: (phone_key, [строки анкет по дате регистрации])
+    cursor = conn.execute(DUPLICATES_QUERY)
+    for key, rows in groupby(cursor, key=lambda row: row[0]):
+        yield key, [row[1:] for row in rows]
+
+def write_duplicates(conn, output):
+    writer = csv.writer(output)
+    writer.writerow([
+        'группа', 'телефон', 'user_id', 'фамилия', 'имя', 'отчество',
+        'дата рождения', 'номер в анкете', 'дата регистрации', 'заблокирован'
+    ])
+    groups = 0
+    users = 0
+    for group, (key, rows) in enumerate(find_duplicates(conn), start=1):
+        for user_id, last_name, first_name, patronymic, birth_date, phone, registered, banned in rows:
+            writer.writerow([
+                group, f'+{key}', user_id, last_name, first_name, patronymic,
+                decode_birth_date(birth_date), phone,
+                from_timestamp(registered).strftime('%d.%m.%Y %H:%M:%S'),
+                'да' if banned else 'нет'
+            ])
+        groups = group
+        users += len(rows)
+    return groups, users
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск анкет с одинаковым телефоном')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--output', default='duplicates.csv')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    started = time.perf_counter()
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        migrate(conn)
+        with open(args.output, 'w', newline='', encoding='utf-8-sig') as f:
+            groups, users = write_duplicates(conn, f)
+    finally:
+        conn.close()
+    print(f"Групп с одинаковым номером: {groups}, анкет в них: {users} "
+          f"(см. {args.output}), {time.perf_counter() - started:.1f} с")
+
+if __name__ == '__main__':
+    main()
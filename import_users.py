@@ -0,0 +1,207 @@
+# Импорт списков кандидатов из CSV/XLSX от партнерских офисов.
+# Файл читается потоком, строки проверяются пачками по правилам анкеты
+# (validation.RowValidator), прошедшие проверку записываются executemany
+# одной транзакцией на пачку, отклоненные - в CSV-файл ошибок с причиной.
+# Память не зависит от размера файла: в ней только текущая пачка.
+# Запуск: python import_users.py candidates.xlsx --errors rejects.csv
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import time
+
+from database import DB_PATH, migrate, record_new_users
+from validation import RowValidator, phone_key
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 10000  # Строк в одной транзакции
+HEADER_SEARCH_ROWS = 10  # Сколько первых строк просматриваем в поисках заголовка
+
+# Поле -> допустимые названия столбца (как в БД и как в отчете бота)
+COLUMNS = {
+    'user_id': ('user_id',),
+    'last_name': ('last_name', 'фамилия'),
+    'first_name': ('first_name', 'имя'),
+    'patronymic': ('patronymic', 'отчество'),
+    'birth_date': ('birth_date', 'дата рождения'),
+    'phone_number': ('phone_number', 'телефон'),
+    'military_spec': ('military_spec', 'вус и профессия'),
+    'dental_sanation': ('dental_sanation', 'санация'),
+    'medical_certificates': ('medical_certificates', 'справки'),
+    'foreign_passport': ('foreign_passport', 'загранпаспорт'),
+    'active_contracts': ('active_contracts', 'контракты'),
+}
+# Порядок полей, который ожидает RowValidator
+FIELDS = (
+    'last_name', 'first_name', 'patronymic', 'birth_date', 'phone_number',
+    'military_spec', 'dental_sanation', 'medical_certificates',
+    'foreign_passport', 'active_contracts',
+)
+
+INSERT_QUERY = '''
+    INSERT INTO users (
+        user_id, birth_date, first_name, last_name, patronymic,
+        phone_number, military_spec, dental_sanation, medical_certificates,
+        foreign_passport, active_contracts, registration_date, phone_key
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+def read_rows(path):
+    # Возвращает итератор строк файла (кортежи значений)
+    if path.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            yield from csv.reader(f, dialect)
+
+def find_header(rows):
+    # Ищем строку заголовка среди первых строк: в отчете бота над ней заголовок листа.
+    # Возвращает номер строки и индексы столбцов для user_id и FIELDS
+    names = {}
+    for field, aliases in COLUMNS.items():
+        for alias in aliases:
+            names[alias] = field
+
+    for line, row in enumerate(rows, start=1):
+        positions = {}
+        for index, value in enumerate(row):
+            field = names.get(str(value).strip().lower()) if value is not None else None
+            if field is not None and field not in positions:
+                positions[field] = index
+        if all(field in positions for field in FIELDS):
+            return line, positions.get('user_id'), [positions[field] for field in FIELDS]
+        if line >= HEADER_SEARCH_ROWS:
+            break
+    raise ValueError(f"Не найдена строка заголовка со столбцами: {', '.join(FIELDS)}")
+
+def next_import_id(conn):
+    # У кандидатов из списков нет Telegram id. Им выдаются отрицательные id:
+    # id пользователей Telegram положительные, поэтому пересечений не будет
+    lowest = conn.execute('SELECT MIN(user_id) FROM users').fetchone()[0]
+    return min(lowest or 0, 0) - 1
+
+def existing_ids(conn, user_ids):
+    if not user_ids:
+        return set()
+    placeholders = ', '.join('?' * len(user_ids))
+    cursor = conn.execute(f'SELECT user_id FROM users WHERE user_id IN ({placeholders})', user_ids)
+    return {row[0] for row in cursor}
+
+class Importer:
+    def __init__(self, conn, errors_writer, batch_size=IMPORT_BATCH_SIZE, validator=None):
+        self.conn = conn
+        self.errors = errors_writer
+        self.batch_size = batch_size
+        self.validator = validator or RowValidator()
+        self.imported = 0
+        self.rejected = 0
+        self._next_id = next_import_id(conn)
+
+    def run(self, rows):
+        rows = iter(rows)
+        header_line, id_index, indexes = find_header(rows)
+        self.errors.writerow(['строка', 'причина'] + list(FIELDS))
+
+        batch = []
+        for line, row in enumerate(rows, start=header_line + 1):
+            if not any(value not in (None, '') for value in row):
+                continue  # Пустые строки пропускаем молча
+            width = len(row)
+            user_id = row[id_index] if id_index is not None and id_index < width else None
+            batch.append((line, user_id, tuple(row[i] if i < width else None for i in indexes)))
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _reject(self, line, reason, values):
+        self.rejected += 1
+        self.errors.writerow([line, reason, *('' if value is None else value for value in values)])
+
+    def _write_batch(self, batch):
+        results = self.validator.validate_batch([values for _, _, values in batch])
+        now = int(time.time())
+
+        # Явно указанные user_id проверяем на повторы в файле и в БД
+        explicit = {}
+        for line, user_id, values in batch:
+            if user_id in (None, ''):
+                continue
+            try:
+                explicit[line] = int(user_id)
+            except (TypeError, ValueError):
+                explicit[line] = None
+        taken = existing_ids(self.conn, [i for i in set(explicit.values()) if i is not None])
+
+        params = []
+        for (line, _, values), (row, reason) in zip(batch, results):
+            if row is None:
+                self._reject(line, reason, values)
+                continue
+            if line in explicit:
+                user_id = explicit[line]
+                if user_id is None or user_id <= 0:
+                    self._reject(line, 'неверный user_id', values)
+                    continue
+                if user_id in taken:
+                    self._reject(line, 'пользователь уже зарегистрирован', values)
+                    continue
+                taken.add(user_id)
+            else:
+                user_id = self._next_id
+                self._next_id -= 1
+            params.append((user_id, *row, now, phone_key(row[4])))
+
+        with self.conn:
+            self.conn.executemany(INSERT_QUERY, params)
+            record_new_users(self.conn, params)
+        self.imported += len(params)
+        logger.info("Imported %d rows, rejected %d", self.imported, self.rejected)
+
+def import_file(path, errors_path, db_path=DB_PATH, batch_size=IMPORT_BATCH_SIZE):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    migrate(conn)
+    try:
+        with open(errors_path, 'w', newline='', encoding='utf-8') as f:
+            importer = Importer(conn, csv.writer(f), batch_size)
+            importer.run(read_rows(path))
+    finally:
+        conn.close()
+    return importer.imported, importer.rejected
+
+def main():
+    parser = argparse.ArgumentParser(description='Импорт кандидатов из CSV/XLSX')
+    parser.add_argument('path')
+    parser.add_argument('--errors', help='CSV с отклоненными строками')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    errors_path = args.errors or os.path.splitext(args.path)[0] + '_errors.csv'
+    started = time.perf_counter()
+    imported, rejected = import_file(args.path, errors_path, args.db, args.batch_size)
+    print(f"Загружено: {imported}, отклонено: {rejected} (см. {errors_path}), "
+          f"{time.perf_counter() - started:.1f} с")
+
+if __name__ == '__main__':
+    main()
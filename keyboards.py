@@ -1,20 +1,44 @@
-from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
+from functools import lru_cache
 
-def get_yes_no_keyboard():
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
+
+REPORT_PERIOD_LABELS = ("За день", "За неделю", "За месяц", "За год")
+
+# Объекты клавиатур неизменяемы, поэтому каждая собирается один раз
+# и дальше отдается одним и тем же объектом
+
+@lru_cache(maxsize=None)
+def get_yes_no_keyboard(yes='Да', no='Нет'):
     keyboard = [
-        ['Да', 'Нет']
+        [yes, no]
     ]
     return ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
 
-def get_report_period_keyboard():
+@lru_cache(maxsize=256)
+def get_report_period_keyboard(labels=REPORT_PERIOD_LABELS, vus=None):
+    # С кодом ВУС кнопки заказывают отчет только по этому коду: report_day_837
+    day, week, month, year = labels
+    suffix = f"_{vus}" if vus is not None else ""
     keyboard = [
         [
-            InlineKeyboardButton("За день", callback_data="report_day"),
-            InlineKeyboardButton("За неделю", callback_data="report_week")
+            InlineKeyboardButton(day, callback_data=f"report_day{suffix}"),
+            InlineKeyboardButton(week, callback_data=f"report_week{suffix}")
         ],
         [
-            InlineKeyboardButton("За месяц", callback_data="report_month"),
-            InlineKeyboardButton("За год", callback_data="report_year")
+            InlineKeyboardButton(month, callback_data=f"report_month{suffix}"),
+            InlineKeyboardButton(year, callback_data=f"report_year{suffix}")
         ]
     ]
-    return InlineKeyboardMarkup(keyboard) 
\ No newline at end of file
+    return InlineKeyboardMarkup(keyboard)
+
+@lru_cache(maxsize=256)
+def get_find_keyboard(page, has_next, back='◀ Назад', forward='Вперед ▶'):
+    # Листание результатов /find; номер страницы - в callback_data
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(back, callback_data=f"find_{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(forward, callback_data=f"find_{page + 1}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
@@ -0,0 +1,147 @@
+# Запуск нескольких процессов-воркеров бота на одной машине.
+# Главный процесс получает обновления через long polling и раздает их
+# воркерам по user_id, так что обновления одного пользователя всегда
+# попадают в один и тот же воркер. Админы и блокировки воркеры делят
+# через общий SQLite-файл (STATE_BACKEND=sqlite). Общий лимит отправки
+# Telegram (OUTBOUND_RATE) делится между воркерами поровну.
+# Запуск: python launcher.py --workers 4
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+from dotenv import load_dotenv
+from telegram import Bot, Update
+from telegram.error import InvalidToken, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30  # Таймаут long polling, секунд
+POLL_RETRY_DELAY = 1  # Первая пауза после сетевой ошибки, секунд
+POLL_MAX_RETRY_DELAY = 30  # Пауза растет вдвое, но не больше этого
+
+def shard_for(update, workers):
+    # Ключ шардирования: пользователь, иначе чат, иначе номер обновления
+    if update.effective_user is not None:
+        key = update.effective_user.id
+    elif update.effective_chat is not None:
+        key = update.effective_chat.id
+    else:
+        key = update.update_id
+    return key % workers
+
+def worker_main(index, updates):
+    # Остановкой воркеров управляет главный процесс через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # У каждого воркера свой порт метрик
+    import metrics
+    if metrics.METRICS_PORT:
+        metrics.METRICS_PORT = str(int(metrics.METRICS_PORT) + index)
+    import bot
+    logger.info("Worker %d started", index)
+    asyncio.run(_serve(bot.build_application(), updates))
+
+async def _serve(application, updates):
+    # Порядок как в run_polling и webhook.run_webhook: post_shutdown вызывается
+    # после application.shutdown(), то есть после выхода из async with
+    loop = asyncio.get_running_loop()
+    try:
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            try:
+                while True:
+                    # Очередь процессов блокирующая, поэтому читаем её в отдельном потоке
+                    data = await loop.run_in_executor(None, updates.get)
+                    if data is None:
+                        break
+                    await application.update_queue.put(Update.de_json(data, application.bot))
+            finally:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+    finally:
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+async def _with_retries(request, name):
+    # Как run_polling: ошибки сети, ответы прокси вместо Bot API и флуд-лимит
+    # не останавливают бота, запрос повторяется с растущей паузой.
+    # request - функция без аргументов, возвращающая корутину запроса
+    delay = POLL_RETRY_DELAY
+    while True:
+        try:
+            return await request()
+        except RetryAfter as e:
+            logger.warning("Flood limit on %s, retry in %s s", name, e.retry_after)
+            await asyncio.sleep(e.retry_after)
+        except InvalidToken:
+            raise
+        except TelegramError as e:
+            # Сюда попадают и NetworkError, и TimedOut
+            logger.warning("%s failed: %s, retry in %s s", name, e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_RETRY_DELAY)
+
+async def poll(token, queues):
+    # Тот же сервер Bot API, что и у воркеров (см. build_application в bot.py)
+    api_url = os.getenv('BOT_API_URL')
+    bot = Bot(token, base_url=api_url) if api_url else Bot(token)
+    async with bot:
+        await _with_retries(bot.delete_webhook, 'deleteWebhook')
+        offset = None
+        while True:
+            updates = await _with_retries(lambda: bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+            ), 'getUpdates')
+            for update in updates:
+                offset = update.update_id + 1
+                queues[shard_for(update, len(queues))].put(update.to_dict())
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    load_dotenv()
+    # Воркеры наследуют окружение и создают общее состояние в SQLite
+    os.environ['STATE_BACKEND'] = 'sqlite'
+    # Лимит Telegram один на бота, а очередь отправки у каждого воркера своя.
+    # Пользователи распределены по воркерам равномерно, поэтому делим поровну
+    import sender
+    os.environ['OUTBOUND_RATE'] = str(sender.OUTBOUND_RATE / args.workers)
+
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(args.workers)]
+    processes = [
+        context.Process(target=worker_main, args=(i, queue), name=f'worker-{i}')
+        for i, queue in enumerate(queues)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGTERM (systemd, docker stop) останавливает так же, как Ctrl+C:
+    # воркеры получают None и завершаются, а не остаются сиротами
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        asyncio.run(poll(os.getenv('BOT_TOKEN'), queues))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join()
+
+if __name__ == '__main__':
+    main()
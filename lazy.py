@@ -0,0 +1,30 @@
+# Объект, который создается при первом обращении к нему. Так импорт бота
+# не открывает файлы БД и общего состояния и не запускает процессы пула:
+# всё это происходит на первом обновлении. Атрибуты и методы берутся
+# у созданного объекта.
+import threading
+
+class Lazy:
+    def __init__(self, factory, *args, **kwargs):
+        object.__setattr__(self, '_factory', (factory, args, kwargs))
+        object.__setattr__(self, '_target', None)
+        object.__setattr__(self, '_load_lock', threading.Lock())
+
+    def _load(self):
+        # Первое обращение может прийти и из event loop, и из другого потока
+        with self._load_lock:
+            if self._target is None:
+                factory, args, kwargs = self._factory
+                object.__setattr__(self, '_target', factory(*args, **kwargs))
+        return self._target
+
+    def __getattr__(self, name):
+        # Вызывается только для атрибутов, которых нет у самой обертки
+        return getattr(self._target or self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._target or self._load(), name, value)
+
+def loaded(proxy):
+    # Созданный объект или None, если к нему еще не обращались
+    return proxy._target
@@ -0,0 +1,330 @@
+# Тексты сообщений бота, прогресс-бары и клавиатуры.
+# Все сообщения собираются один раз при запуске для каждого языка,
+# обработчики только выбирают готовый объект по ключу.
+# Новый язык добавляется словарем в TEXTS с теми же ключами.
+from datetime import datetime
+
+from database import decode_birth_date
+from keyboards import (
+    REMOVE_KEYBOARD, get_find_keyboard, get_report_period_keyboard, get_yes_no_keyboard
+)
+from sender import outbox
+
+DEFAULT_LANGUAGE = 'ru'
+TOTAL_STEPS = 8  # Общее количество шагов анкеты
+MAX_REGISTRATION_ATTEMPTS = 3
+
+TEXTS = {
+    'ru': {
+        'yes': 'Да',
+        'no': 'Нет',
+        'report_periods': ('За день', 'За неделю', 'За месяц', 'За год'),
+        'progress_title': 'Прогресс заполнения анкеты:',
+        'start': (
+            "Здравствуйте! Для продолжения регистрации, пожалуйста, "
+            "ответьте на несколько вопросов.\n\n"
+            "У вас осталось {attempts_left} попыток регистрации."
+        ),
+        'birth_date': (
+            "Укажите вашу дату рождения в формате ДД.ММ.ГГГГ\n"
+            "Например: 01.01.1990"
+        ),
+        'birth_date_invalid': (
+            "Неверный формат даты или возраст не соответствует требованиям (18-65 лет).\n"
+            "Пожалуйста, используйте формат ДД.ММ.ГГГГ\n"
+            "Например: 01.01.1990"
+        ),
+        'full_name': (
+            "Введите ваши ФИО (Фамилия Имя Отчество).\n"
+            "Пример: Иванов Иван Иванович\n"
+            "Используйте только русские буквы, пробел и дефис."
+        ),
+        'full_name_incomplete': (
+            "Пожалуйста, введите полные ФИО через пробел.\n"
+            "Пример: Иванов Иван Иванович"
+        ),
+        'full_name_invalid': (
+            "Неверный формат ФИО. Используйте только русские буквы, пробел и дефис.\n"
+            "Пример: Иванов Иван Иванович"
+        ),
+        'last_name_invalid': (
+            "Неверный формат фамилии. Используйте только русские буквы, пробел и дефис."
+        ),
+        'patronymic': (
+            "Введите ваше отчество.\n"
+            "Используйте только русские буквы, пробел и дефис."
+        ),
+        'patronymic_invalid': (
+            "Неверный формат отчества. Используйте только русские буквы, пробел и дефис."
+        ),
+        'phone_number': (
+            "Введите ваш номер телефона.\n"
+            "Например: +79999999999 или 89999999999"
+        ),
+        'phone_number_invalid': (
+            "Неверный формат номера телефона.\n"
+            "Примеры правильного формата:\n"
+            "+79999999999\n"
+            "89999999999\n"
+            "9999999999\n"
+            "+12345678901 (международный формат)\n\n"
+            "Номер должен содержать от 10 до 15 цифр."
+        ),
+        'phone_number_taken': (
+            "Этот номер телефона уже использован при регистрации.\n"
+            "Введите другой номер или обратитесь к администратору."
+        ),
+        'military_spec': (
+            "Укажите номера ВУС и профессии через точку с запятой (;)\n\n"
+            "Примеры:\n"
+            "837, 166, 461; Плотник, Маляр, Крановщик - если несколько ВУС и профессий\n"
+            "837; Плотник - если одна ВУС и профессия\n"
+            "нет - если нет ВУС и профессии"
+        ),
+        'military_spec_invalid': (
+            "Неверный формат. Укажите номера ВУС и профессии через точку с запятой (;)\n\n"
+            "Примеры:\n"
+            "837, 166, 461; Плотник, Маляр, Крановщик - если несколько ВУС и профессий\n"
+            "837; Плотник - если одна ВУС и профессия\n"
+            "нет - если нет ВУС и профессии"
+        ),
+        'dental_sanation': "Есть ли у вас санация полости рта?",
+        'medical_certificates': "Есть ли у вас справки ВИЧ/Сифилис/Гепатит?",
+        'foreign_passport': "Есть ли у вас загранпаспорт?",
+        'active_contracts': "Есть ли у вас действующие контракты с силовыми ведомствами?",
+        'yes_no_invalid': "Пожалуйста, выберите 'Да' или 'Нет' на клавиатуре.",
+        'saved': (
+            "Спасибо! Ваши данные успешно сохранены.\n"
+            "Если вам нужно заполнить анкету повторно, используйте команду /start"
+        ),
+        'already_registered': (
+            "Вы уже регистрировались ранее.\n"
+            "Если нужно обновить данные, обратитесь к администратору."
+        ),
+        'save_error': "Произошла ошибка при сохранении данных. Пожалуйста, попробуйте позже.",
+        'cancelled': (
+            "Регистрация отменена. Все введённые данные удалены.\n"
+            "Чтобы начать регистрацию заново, используйте команду /start"
+        ),
+        'access_denied': "Доступ запрещен.",
+        'attempts_exhausted': (
+            "Вы уже использовали максимальное количество попыток регистрации "
+            f"({MAX_REGISTRATION_ATTEMPTS})."
+        ),
+        'key_attempts_blocked': "Доступ заблокирован из-за превышения лимита попыток.",
+        'choose_report_period': "Выберите период для отчета:",
+        'report_error': "Ошибка при создании отчета: {error}",
+        'export_usage': (
+            "Укажите период выгрузки: /export ДД.ММ.ГГГГ ДД.ММ.ГГГГ\n"
+            "Например: /export 01.01.2024 31.12.2024"
+        ),
+        'find_usage': (
+            "Укажите фамилию, имя, телефон или ВУС: /find Иванов Иван\n"
+            "Можно вводить начало слова, не короче двух букв."
+        ),
+        'find_empty': "Ничего не найдено.",
+        'find_title': "Результаты поиска, страница {page}:",
+        'find_row': "{number}. {last_name} {first_name} {patronymic}, {birth_date}\n"
+                    "    {phone}, ВУС: {spec}\n    Регистрация: {registered:%d.%m.%Y %H:%M}",
+        'find_back': '◀ Назад',
+        'find_forward': 'Вперед ▶',
+        'choose_vus_report_period': "Выберите период для отчета по ВУС {vus}:",
+        'vus_invalid': "Код ВУС - это 3-4 цифры, например: /report 837",
+        'stats_title': "Статистика регистраций",
+        'stats_vus_title': "Статистика регистраций, ВУС {vus}",
+        'stats_periods': {'day': 'За сегодня', 'week': 'За неделю', 'month': 'За месяц'},
+        'stats_count': "{period}: {count}",
+        'stats_fields': {
+            'dental_sanation': 'санация',
+            'medical_certificates': 'справки',
+            'foreign_passport': 'загранпаспорт',
+            'active_contracts': 'контракты',
+        },
+        'stats_share': "  {field}: {share:.0%} «Да»",
+        'stats_top_vus': "  ВУС: {codes}",
+        'stats_no_vus': "нет данных",
+    },
+}
+
+YES_NO = 'yes_no'
+REPORT_PERIODS = 'report_periods'
+REMOVE = 'remove'
+
+# Ключ сообщения -> (ключ текста, шаг прогресс-бара или None, клавиатура)
+LAYOUT = {
+    'full_name': ('full_name', 2, None),
+    'full_name_incomplete': ('full_name_incomplete', None, None),
+    'full_name_invalid': ('full_name_invalid', None, None),
+    'last_name_invalid': ('last_name_invalid', None, None),
+    'patronymic': ('patronymic', None, None),
+    'patronymic_invalid': ('patronymic_invalid', None, None),
+    'birth_date_invalid': ('birth_date_invalid', None, None),
+    'phone_number': ('phone_number', None, None),
+    'phone_number_invalid': ('phone_number_invalid', 3, None),
+    'phone_number_taken': ('phone_number_taken', 3, None),
+    'military_spec': ('military_spec', 4, None),
+    'military_spec_invalid': ('military_spec_invalid', 4, None),
+    'dental_sanation': ('dental_sanation', 5, YES_NO),
+    'dental_sanation_invalid': ('yes_no_invalid', 5, YES_NO),
+    'medical_certificates': ('medical_certificates', 6, YES_NO),
+    'medical_certificates_invalid': ('yes_no_invalid', 6, YES_NO),
+    'foreign_passport': ('foreign_passport', 7, YES_NO),
+    'foreign_passport_invalid': ('yes_no_invalid', 7, YES_NO),
+    'active_contracts': ('active_contracts', 8, YES_NO),
+    'active_contracts_invalid': ('yes_no_invalid', 8, YES_NO),
+    'saved': ('saved', None, REMOVE),
+    'already_registered': ('already_registered', None, REMOVE),
+    'save_error': ('save_error', None, REMOVE),
+    'cancelled': ('cancelled', None, REMOVE),
+    'access_denied': ('access_denied', None, None),
+    'attempts_exhausted': ('attempts_exhausted', None, None),
+    'key_attempts_blocked': ('key_attempts_blocked', None, None),
+    'choose_report_period': ('choose_report_period', None, REPORT_PERIODS),
+    'export_usage': ('export_usage', None, None),
+    'vus_invalid': ('vus_invalid', None, None),
+    'find_usage': ('find_usage', None, None),
+    'find_empty': ('find_empty', None, None),
+}
+
+def generate_progress_bar(current_step, title, total_steps=TOTAL_STEPS):
+    filled = "⬢"  # Заполненный символ
+    empty = "⬡"   # Пустой символ
+    progress = (current_step / total_steps) * 100
+
+    bar = ""
+    bar += f"\n\n<b>{title}</b>\n"
+    bar += filled * current_step + empty * (total_steps - current_step)
+    bar += f" {current_step}/{total_steps} ({progress:.0f}%)\n\n"
+
+    return bar
+
+class Message:
+    # Готовое сообщение: текст, клавиатура и режим разметки
+    __slots__ = ('text', 'reply_markup', 'parse_mode')
+
+    def __init__(self, text, reply_markup=None, parse_mode=None):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+
+    async def send(self, message):
+        # Ставит ответ на входящее сообщение telegram.Message в очередь отправки
+        # и сразу возвращает future: обработчик не ждет Bot API
+        return outbox.reply_text(
+            message, self.text, reply_markup=self.reply_markup, parse_mode=self.parse_mode
+        )
+
+    async def edit(self, message):
+        # Заменяет текст и клавиатуру уже отправленного ботом сообщения
+        return outbox.edit_text(
+            message, self.text, reply_markup=self.reply_markup, parse_mode=self.parse_mode
+        )
+
+class MessageTemplates:
+    # Все сообщения одного языка, собранные заранее
+    def __init__(self, language=DEFAULT_LANGUAGE):
+        texts = TEXTS[language]
+        self.language = language
+        self.yes = texts['yes']
+        self.no = texts['no']
+        self.answers = (self.yes, self.no)
+        self._report_error = texts['report_error']
+        self._texts = texts
+
+        keyboards = {
+            None: None,
+            YES_NO: get_yes_no_keyboard(self.yes, self.no),
+            REPORT_PERIODS: get_report_period_keyboard(texts['report_periods']),
+            REMOVE: REMOVE_KEYBOARD,
+        }
+        bars = {
+            step: generate_progress_bar(step, texts['progress_title'])
+            for step in range(1, TOTAL_STEPS + 1)
+        }
+
+        self._messages = {}
+        for key, (text_key, step, keyboard) in LAYOUT.items():
+            if step is None:
+                message = Message(texts[text_key], keyboards[keyboard])
+            else:
+                message = Message(bars[step] + texts[text_key], keyboards[keyboard], 'HTML')
+            self._messages[key] = message
+
+        # Приветствие зависит только от числа оставшихся попыток
+        self._start = {
+            attempts_left: Message(
+                texts['start'].format(attempts_left=attempts_left)
+                + bars[1] + texts['birth_date'],
+                parse_mode='HTML'
+            )
+            for attempts_left in range(1, MAX_REGISTRATION_ATTEMPTS + 1)
+        }
+
+    def __getitem__(self, key):
+        return self._messages[key]
+
+    def start(self, attempts_left):
+        return self._start[attempts_left]
+
+    def report_error(self, error):
+        # Текст ошибки заранее неизвестен, это сообщение собирается на месте
+        return Message(self._report_error.format(error=error))
+
+    def find_results(self, rows, page, page_size):
+        # Страница результатов /find из Database.search_users.
+        # rows может содержать лишнюю строку - признак следующей страницы
+        texts = self._texts
+        lines = [texts['find_title'].format(page=page + 1)]
+        for number, (_, last_name, first_name, patronymic, birth_date, phone, spec,
+                     registered) in enumerate(rows[:page_size], start=page * page_size + 1):
+            lines.append(texts['find_row'].format(
+                number=number, last_name=last_name, first_name=first_name,
+                patronymic=patronymic, birth_date=decode_birth_date(birth_date),
+                phone=phone, spec=spec, registered=datetime.fromtimestamp(registered)
+            ))
+        keyboard = get_find_keyboard(
+            page, len(rows) > page_size, texts['find_back'], texts['find_forward']
+        )
+        return Message('\n\n'.join(lines), keyboard)
+
+    def choose_report_period(self, vus=None):
+        # Выбор периода отчета; с кодом ВУС - отчет только по нему
+        if vus is None:
+            return self['choose_report_period']
+        texts = self._texts
+        return Message(
+            texts['choose_vus_report_period'].format(vus=vus),
+            get_report_period_keyboard(texts['report_periods'], vus)
+        )
+
+    def stats(self, stats, vus=None):
+        # Сводка для /stats из Database.get_stats
+        texts = self._texts
+        if vus is None:
+            title = texts['stats_title']
+        else:
+            title = texts['stats_vus_title'].format(vus=vus)
+        lines = [f"<b>{title}</b>"]
+        for period, (count, shares, top_vus) in stats.items():
+            lines.append('')
+            lines.append(texts['stats_count'].format(
+                period=texts['stats_periods'][period], count=count
+            ))
+            for field, share in shares.items():
+                lines.append(texts['stats_share'].format(
+                    field=texts['stats_fields'][field], share=share
+                ))
+            if vus is None:
+                codes = ', '.join(f"{code} ({total})" for code, total in top_vus)
+                lines.append(texts['stats_top_vus'].format(codes=codes or texts['stats_no_vus']))
+        return Message('\n'.join(lines), parse_mode='HTML')
+
+TEMPLATES = {language: MessageTemplates(language) for language in TEXTS}
+
+def get_templates(language=None):
+    return TEMPLATES.get(language) or TEMPLATES[DEFAULT_LANGUAGE]
+
+def for_update(update):
+    # Язык берется из настроек Telegram пользователя
+    user = update.effective_user
+    return get_templates(user.language_code if user is not None else None)
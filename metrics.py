@@ -0,0 +1,162 @@
+# Метрики бота в формате Prometheus: гистограммы задержек обработчиков,
+# методов Database, запросов к Bot API и сборки отчетов.
+# Серия (набор значений меток) создается один раз, обычно при запуске;
+# запись значения - это bisect по границам и два сложения, без создания
+# списков, словарей и строк. Счетчики не защищены блокировкой: при гонке
+# потоков БД можно потерять единичное наблюдение, для метрик это допустимо.
+# Метрики отдаются локальным HTTP-сервером: GET http://127.0.0.1:9108/metrics
+# (каждый воркер launcher.py слушает свой порт: METRICS_PORT + номер воркера)
+import functools
+import inspect
+import logging
+import os
+from bisect import bisect_left
+from time import perf_counter
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = os.getenv('METRICS_PORT', '9108')  # Пустое значение отключает сервер
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 КБ .. 256 МБ
+
+REGISTRY = []
+_collectors = []
+
+class _Series:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Последняя ячейка - +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        # Возвращает серию для значений меток; на горячем пути серию
+        # нужно получить заранее и дальше вызывать только observe
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = _Series(self.buckets)
+        return series
+
+    def timed(self, *values):
+        # Декоратор: время выполнения функции или корутины в серию values
+        series = self.labels(*values)
+
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        series.observe(perf_counter() - started)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    series.observe(perf_counter() - started)
+            return wrapper
+
+        return decorator
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        for values, series in list(self._series.items()):
+            labels = ','.join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)
+            )
+            prefix = labels + ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {cumulative}')
+            cumulative += series.counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {series.sum!r}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return '\n'.join(lines)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def add_collector(name, documentation, callback):
+    # Метрика-датчик, значение которой читается в момент запроса /metrics
+    _collectors.append((name, documentation, callback))
+
+def render():
+    parts = [metric.render() for metric in REGISTRY]
+    for name, documentation, callback in _collectors:
+        parts.append(f'# HELP {name} {documentation}\n# TYPE {name} gauge\n{name} {callback()}')
+    return '\n'.join(parts) + '\n'
+
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds', 'Время обработчиков по состояниям анкеты', ('handler', 'state')
+)
+TELEGRAM_SECONDS = Histogram(
+    'bot_telegram_request_seconds', 'Время запросов к Bot API', ('method',)
+)
+
+def timed_handler(callback, state):
+    # Оборачивает обработчик PTB: время попадает в серию (имя, состояние)
+    return HANDLER_SECONDS.timed(callback.__name__, state)(callback)
+
+class MetricsServer:
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = int(port)
+        self._runner = None
+
+    async def start(self):
+        # aiohttp нужен только при включенном сервере метрик
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        try:
+            await site.start()
+        except OSError:
+            await self._runner.cleanup()
+            self._runner = None
+            raise
+        self.port = self._runner.addresses[0][1]
+        logger.info("Metrics available at http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        from aiohttp import web
+        return web.Response(
+            body=render().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )
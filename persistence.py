@@ -0,0 +1,157 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+PERSISTENCE_PATH = 'bot_state.db'  # Отдельный файл, чтобы не мешать записи регистраций
+PERSISTENCE_INTERVAL = 10  # Как часто PTB передает изменения, секунд
+
+USER_DATA = 'user'
+
+def _conversation_kind(name):
+    return f'conversation:{name}'
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+class SQLitePersistence(BasePersistence):
+    # Хранит состояния ConversationHandler и context.user_data в SQLite.
+    # Пишутся только изменившиеся записи, пачкой в одной транзакции;
+    # user_data пользователя читается при первом его обновлении.
+    def __init__(self, path=PERSISTENCE_PATH, update_interval=PERSISTENCE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS entries (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        ''')
+        self.conn.commit()
+
+        # Все обращения к файлу идут через один поток
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persistence')
+        self._loaded_users = set()
+        self._known = {}  # (kind, key) -> последнее записанное значение
+        self._dirty = {}  # (kind, key) -> новое значение или None для удаления
+        self._write_task = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _select(self, kind, key=None):
+        cursor = self.conn.cursor()
+        if key is None:
+            cursor.execute('SELECT key, value FROM entries WHERE kind = ?', (kind,))
+            return cursor.fetchall()
+        cursor.execute('SELECT value FROM entries WHERE kind = ? AND key = ?', (kind, key))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _write_batch(self, batch):
+        upserts = [(kind, key, value) for (kind, key), value in batch.items() if value is not None]
+        deletes = [(kind, key) for (kind, key), value in batch.items() if value is None]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO entries (kind, key, value) VALUES (?, ?, ?)', upserts
+            )
+            self.conn.executemany('DELETE FROM entries WHERE kind = ? AND key = ?', deletes)
+
+    def _stage(self, kind, key, value):
+        entry = (kind, key)
+        if self._known.get(entry) == value and entry not in self._dirty:
+            return  # Ничего не изменилось
+        self._known[entry] = value
+        self._dirty[entry] = value
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.get_running_loop().create_task(self._write_dirty())
+
+    async def _write_dirty(self):
+        # PTB вызывает update_* пачкой через gather; даем им всем отработать
+        # и записываем накопленное одной транзакцией
+        await asyncio.sleep(0)
+        while self._dirty:
+            batch, self._dirty = self._dirty, {}
+            await self._run(self._write_batch, batch)
+
+    async def get_user_data(self):
+        # Данные пользователей загружаются лениво в refresh_user_data
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        key = str(user_id)
+        value = await self._run(self._select, USER_DATA, key)
+        if value is not None:
+            self._known.setdefault((USER_DATA, key), value)
+            if not user_data:
+                user_data.update(json.loads(value))
+
+    async def update_user_data(self, user_id, data):
+        self._stage(USER_DATA, str(user_id), _dump(data))
+
+    async def drop_user_data(self, user_id):
+        self._stage(USER_DATA, str(user_id), None)
+
+    async def get_conversations(self, name):
+        # Состояния - небольшие целые числа, их читаем целиком при запуске
+        rows = await self._run(self._select, _conversation_kind(name))
+        conversations = {}
+        for key, value in rows:
+            self._known[(_conversation_kind(name), key)] = value
+            conversations[tuple(json.loads(key))] = json.loads(value)
+        return conversations
+
+    async def update_conversation(self, name, key, new_state):
+        value = None if new_state is None else _dump(new_state)
+        self._stage(_conversation_kind(name), _dump(list(key)), value)
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        if self._dirty:
+            batch, self._dirty = self._dirty, {}
+            await self._run(self._write_batch, batch)
+        self._executor.shutdown(wait=True)
+        self.conn.close()
+
+    # chat_data, bot_data и callback_data бот не использует
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+MAX_PENDING_UPDATES = 4096  # Сколько обновлений может ждать своей очереди
+WAIT_SAMPLES = 1024  # Сколько последних ожиданий храним для перцентилей
+
+def _update_key(update):
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # Обновления разных пользователей обрабатываются параллельно (не больше
+    # max_concurrent штук), а обновления одного пользователя - строго по очереди,
+    # чтобы не сломать состояние ConversationHandler.
+    def __init__(self, max_concurrent=MAX_CONCURRENT_UPDATES, max_pending=MAX_PENDING_UPDATES):
+        # Семафор базового класса ограничивает общее число принятых обновлений,
+        # а реальный лимит параллельности применяется уже после очереди пользователя:
+        # иначе очередь одного пользователя занимала бы чужие слоты
+        super().__init__(max(max_concurrent, max_pending))
+        self.max_concurrent = max_concurrent
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tails = {}  # ключ пользователя -> future последнего обновления в очереди
+        self._pending = {}  # ключ пользователя -> число обновлений в обработке и ожидании
+        self._last_wait = {}  # ключ пользователя -> последнее время ожидания
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.in_flight = 0
+        self.queued = 0
+        self.processed = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update, coroutine):
+        key = _update_key(update)
+        enqueued = time.perf_counter()
+        self.queued += 1
+
+        # Встаем в цепочку обновлений этого пользователя до первого await,
+        # поэтому порядок в цепочке совпадает с порядком поступления
+        previous = done = None
+        if key is not None:
+            previous = self._tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._tails[key] = done
+            self._pending[key] = self._pending.get(key, 0) + 1
+
+        started = False
+        try:
+            if previous is not None:
+                # shield: отмена этого обновления не должна отменять future
+                # предыдущего, его выставит сама задача предыдущего обновления
+                await asyncio.shield(previous)
+            async with self._slots:
+                started = True
+                wait = time.perf_counter() - enqueued
+                self._waits.append(wait)
+                if key is not None:
+                    self._last_wait[key] = wait
+                self.queued -= 1
+                self.in_flight += 1
+                try:
+                    await coroutine
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+        finally:
+            if not started:
+                self.queued -= 1
+                # Обновление отменили в очереди: корутина обработчика так и не запускалась
+                coroutine.close()
+            if key is not None:
+                if previous is not None and not previous.done():
+                    # Следующие обновления пользователя не должны обогнать
+                    # предыдущее, поэтому наша очередь освобождается вместе с ним
+                    previous.add_done_callback(lambda _: self._release(key, done))
+                else:
+                    self._release(key, done)
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    del self._pending[key]
+                    self._last_wait.pop(key, None)
+
+    def _release(self, key, done):
+        if not done.done():
+            done.set_result(None)
+        if self._tails.get(key) is done:
+            del self._tails[key]
+
+    def snapshot(self):
+        # Метрики: глубина очереди, число занятых слотов и время ожидания
+        waits = sorted(self._waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(len(waits) * p / 100))] if waits else 0.0
+
+        return {
+            'queue_depth': self.queued,
+            'in_flight': self.in_flight,
+            'processed': self.processed,
+            'wait_p50': percentile(50),
+            'wait_p95': percentile(95),
+            'wait_max': waits[-1] if waits else 0.0,
+            'per_user': {
+                key: {'pending': pending, 'last_wait': self._last_wait.get(key)}
+                for key, pending in self._pending.items()
+            },
+        }
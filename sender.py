@@ -0,0 +1,268 @@
+# Очередь исходящих сообщений к Bot API.
+# Обработчики ставят ответ в очередь и сразу возвращаются, а отправка идет
+# в фоне с учетом лимитов Telegram: общий (около 30 сообщений в секунду
+# на бота) и отдельный для каждого чата. Сообщения одного чата уходят строго
+# по порядку, по одному. Среди готовых к отправке чатов первыми обслуживаются
+# ответы анкеты, отчеты - когда нет ответов. На 429 сообщение повторяется
+# через retry_after из ответа Telegram, на сетевые ошибки - с растущей паузой,
+# ошибка в самом запросе (BadRequest) не повторяется.
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import deque
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Сообщений в секунду на бота. launcher.py делит лимит между воркерами,
+# у каждого из которых своя очередь
+OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', '30'))
+OUTBOUND_BURST = max(1.0, OUTBOUND_RATE)  # Запас на секунду отправки
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))  # Сообщений в секунду на чат
+OUTBOUND_CHAT_BURST = 3
+# Одновременных запросов к Bot API: больше не ускоряет отправку при лимите
+# 30 сообщений в секунду, но раздувает пул соединений httpx
+OUTBOUND_CONCURRENCY = 16
+MAX_RETRIES = 5  # Повторов при сетевых ошибках
+RETRY_BASE_DELAY = 0.5  # Первая пауза перед повтором, секунд
+
+PRIORITY_REPLY = 0  # Ответы в анкете
+PRIORITY_DOCUMENT = 1  # Файлы отчетов
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        # Сколько ждать до следующей отправки; 0 - можно сейчас
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+    def is_full(self, now):
+        return now >= self.blocked_until and self.delay(now) == 0 and self.tokens >= self.capacity
+
+    def full_at(self, now):
+        # Когда лимит полностью восстановится
+        self.delay(now)
+        return max(self.blocked_until, now + (self.capacity - self.tokens) / self.rate)
+
+class _Job:
+    __slots__ = ('factory', 'priority', 'future', 'attempts')
+
+    def __init__(self, factory, priority, future):
+        self.factory = factory
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+
+class _Chat:
+    __slots__ = ('jobs', 'bucket', 'busy', 'scheduled', 'deadline')
+
+    def __init__(self, bucket):
+        self.jobs = deque()
+        self.bucket = bucket
+        self.busy = False  # Сообщение чата сейчас отправляется
+        self.scheduled = False  # Чат стоит в очереди готовых или ждет своего лимита
+        self.deadline = None  # Срок, под которым простаивающий чат стоит в очереди на удаление
+
+def _consume_exception(future):
+    # Ошибка уже записана в лог; обработчики результат отправки не ждут
+    if not future.cancelled():
+        future.exception()
+
+class OutboundQueue:
+    def __init__(self, rate=OUTBOUND_RATE, burst=OUTBOUND_BURST,
+                 chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 concurrency=OUTBOUND_CONCURRENCY, clock=time.monotonic):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.concurrency = concurrency
+        self.clock = clock
+        self._global = TokenBucket(rate, burst, clock())
+        self._chats = {}
+        # Очередь сроков (deadline, chat_id) для чатов, оставшихся без сообщений:
+        # очистка смотрит только на истекшие сроки, а не на все чаты
+        self._idle_deadlines = []
+        # Готовые к отправке чаты, по очереди на каждый приоритет
+        self._ready = (deque(), deque())
+        self._wakeup = None
+        self._idle = None
+        self._slots = None
+        self._worker = None
+        self.pending = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def submit(self, chat_id, factory, priority=PRIORITY_REPLY):
+        # factory - функция без аргументов, возвращающая корутину запроса;
+        # при повторе она вызывается заново. Возвращает future с результатом.
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        future.add_done_callback(_consume_exception)
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(
+                TokenBucket(self.chat_rate, self.chat_burst, self.clock())
+            )
+        chat.jobs.append(_Job(factory, priority, future))
+        self.pending += 1
+        self._idle.clear()
+        if not chat.busy and not chat.scheduled:
+            self._schedule(chat_id, chat)
+        return future
+
+    def reply_text(self, message, text, **kwargs):
+        return self.submit(message.chat_id, lambda: message.reply_text(text, **kwargs))
+
+    def edit_text(self, message, text, **kwargs):
+        return self.submit(message.chat_id, lambda: message.edit_text(text, **kwargs))
+
+    def reply_document(self, message, **kwargs):
+        return self.submit(
+            message.chat_id, lambda: message.reply_document(**kwargs), PRIORITY_DOCUMENT
+        )
+
+    def _schedule(self, chat_id, chat):
+        # Чат становится готовым, когда это позволит его собственный лимит
+        chat.scheduled = True
+        delay = chat.bucket.delay(self.clock())
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._make_ready, chat_id, chat)
+        else:
+            self._make_ready(chat_id, chat)
+
+    def _make_ready(self, chat_id, chat):
+        self._ready[chat.jobs[0].priority].append(chat_id)
+        self._wakeup.set()
+
+    def _pop_ready(self):
+        for ready in self._ready:
+            if ready:
+                return ready.popleft()
+        return None
+
+    async def _run(self):
+        while True:
+            if not (self._ready[0] or self._ready[1]):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._slots.acquire()
+            # Ждем общий лимит до выбора чата: за это время может
+            # освободиться чат с более важным сообщением
+            delay = self._global.delay(self.clock())
+            if delay > 0:
+                self._slots.release()
+                await asyncio.sleep(delay)
+                continue
+
+            chat_id = self._pop_ready()
+            chat = self._chats[chat_id]
+            chat.scheduled = False
+            chat.busy = True
+            self._global.take()
+            chat.bucket.take()
+            asyncio.get_running_loop().create_task(self._send(chat_id, chat, chat.jobs.popleft()))
+
+    async def _send(self, chat_id, chat, job):
+        try:
+            result = await job.factory()
+        except RetryAfter as e:
+            # Telegram сам сообщает, сколько ждать; сообщение остается первым в чате
+            self.retried += 1
+            chat.bucket.block(self.clock() + e.retry_after)
+            chat.jobs.appendleft(job)
+            logger.warning("Flood limit for chat %s, retry in %s s", chat_id, e.retry_after)
+        except BadRequest as e:
+            # В PTB это подкласс NetworkError, но повтор не поможет: текст не изменился,
+            # файл слишком большой, ошибка в разметке
+            self._fail(job, e, chat_id)
+        except NetworkError as e:
+            # Временные ошибки: TimedOut, обрыв соединения, ответ прокси
+            job.attempts += 1
+            if job.attempts > MAX_RETRIES:
+                self._fail(job, e, chat_id)
+            else:
+                self.retried += 1
+                chat.bucket.block(self.clock() + RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+                chat.jobs.appendleft(job)
+        except Exception as e:
+            self._fail(job, e, chat_id)
+        else:
+            self.sent += 1
+            self._done(job)
+            job.future.set_result(result)
+        finally:
+            self._slots.release()
+            chat.busy = False
+            if chat.jobs:
+                self._schedule(chat_id, chat)
+            else:
+                self._schedule_idle(chat_id, chat, self.clock())
+
+    def _schedule_idle(self, chat_id, chat, now):
+        chat.deadline = chat.bucket.full_at(now)
+        heapq.heappush(self._idle_deadlines, (chat.deadline, chat_id))
+
+    def _fail(self, job, error, chat_id):
+        self.failed += 1
+        logger.error("Failed to send message to chat %s: %s", chat_id, error)
+        self._done(job)
+        job.future.set_exception(error)
+
+    def _done(self, job):
+        self.pending -= 1
+        if not self.pending:
+            self._idle.set()
+
+    async def join(self):
+        # Ждет отправки всего, что уже стоит в очереди
+        if self.pending:
+            await self._idle.wait()
+
+    def sweep(self):
+        # Забываем чаты без сообщений, чей лимит уже полностью восстановился
+        now = self.clock()
+        deadlines = self._idle_deadlines
+        evicted = 0
+        while deadlines and deadlines[0][0] <= now:
+            deadline, chat_id = heapq.heappop(deadlines)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.deadline != deadline or chat.jobs or chat.busy:
+                continue  # Чат уже забыт или снова отправляет: срок ему назначат заново
+            if chat.bucket.is_full(now):
+                del self._chats[chat_id]
+                evicted += 1
+            else:
+                self._schedule_idle(chat_id, chat, now)
+        return evicted
+
+# Общая очередь процесса: через нее отвечают все обработчики
+outbox = OutboundQueue()
@@ -0,0 +1,164 @@
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import abuse
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory')  # memory или sqlite
+STATE_PATH = os.getenv('STATE_PATH', 'bot_shared_state.db')
+STATE_REFRESH_INTERVAL = 1  # Как часто перечитываем общих админов и блокировки, секунд
+
+class InProcessState:
+    # Состояние одного процесса: админы и контроль злоупотреблений в памяти
+    def __init__(self, abuse_control=None):
+        self.abuse = abuse_control or abuse.AbuseControl()
+        self._admins = set()
+
+    def add_admin(self, user_id):
+        self._admins.add(user_id)
+
+    def is_admin(self, user_id):
+        return user_id in self._admins
+
+    def is_blocked(self, user_id):
+        return self.abuse.is_blocked(user_id)
+
+    def block(self, user_id):
+        self.abuse.block(user_id)
+
+    def check_message(self, user_id):
+        return self.abuse.check_message(user_id)
+
+    def check_key_attempts(self, user_id):
+        return self.abuse.check_key_attempts(user_id)
+
+    def record_key_attempt(self, user_id):
+        self.abuse.record_key_attempt(user_id)
+
+    def sweep(self):
+        return self.abuse.sweep()
+
+class SQLiteState(InProcessState):
+    # Общее состояние для нескольких процессов-воркеров в одном WAL-файле.
+    # Админы и блокировки видны всем воркерам. Счетчики сообщений и попыток
+    # остаются в памяти воркера: лаунчер закрепляет каждого пользователя
+    # за одним воркером, поэтому они не расходятся.
+    # Обработчики не ходят в файл: проверки идут по снимку админов и блокировок
+    # других воркеров, который перечитывается в фоне не чаще раза
+    # в refresh_interval, а запись уходит в отдельный поток. Свои админы
+    # и блокировки воркер видит сразу через InProcessState.
+    def __init__(self, path=STATE_PATH, abuse_control=None, refresh_interval=STATE_REFRESH_INTERVAL):
+        super().__init__(abuse_control)
+        self.path = path
+        self.refresh_interval = refresh_interval
+        # isolation_level=None: каждая команда - отдельная короткая транзакция
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS admins (
+            user_id INTEGER PRIMARY KEY
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS blocks (
+            user_id INTEGER PRIMARY KEY,
+            blocked_until REAL NOT NULL
+        )
+        ''')
+        self.conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_blocks_until ON blocks (blocked_until)'
+        )
+        # Все обращения к файлу идут через один поток и по порядку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state')
+        self._shared_admins = frozenset()
+        self._shared_blocks = {}  # user_id -> blocked_until
+        self._refreshing = True
+        self._load()
+
+    def _load(self):
+        try:
+            admins = frozenset(row[0] for row in self.conn.execute('SELECT user_id FROM admins'))
+            blocks = dict(self.conn.execute(
+                'SELECT user_id, blocked_until FROM blocks WHERE blocked_until > ?', (time.time(),)
+            ))
+            # Снимки заменяются целиком: в event loop виден либо старый, либо новый
+            self._shared_admins = admins
+            self._shared_blocks = blocks
+        finally:
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+
+    def _refresh(self):
+        # Устаревший снимок перечитывается в фоне, текущая проверка его не ждет
+        if not self._refreshing and time.monotonic() - self._loaded_at >= self.refresh_interval:
+            self._refreshing = True
+            self._executor.submit(self._load).add_done_callback(_log_error)
+
+    def _write(self, sql, params=()):
+        # Запись без ожидания: обработчик не ждет блокировку файла
+        self._executor.submit(self.conn.execute, sql, params).add_done_callback(_log_error)
+
+    def add_admin(self, user_id):
+        super().add_admin(user_id)
+        self._write('INSERT OR IGNORE INTO admins (user_id) VALUES (?)', (user_id,))
+
+    def is_admin(self, user_id):
+        if super().is_admin(user_id):
+            return True
+        self._refresh()
+        return user_id in self._shared_admins
+
+    def _share_block(self, user_id):
+        self._write(
+            'INSERT OR REPLACE INTO blocks (user_id, blocked_until) VALUES (?, ?)',
+            (user_id, time.time() + abuse.BLOCK_TIME)
+        )
+
+    def _shared_blocked(self, user_id):
+        self._refresh()
+        return self._shared_blocks.get(user_id, 0) > time.time()
+
+    def is_blocked(self, user_id):
+        return super().is_blocked(user_id) or self._shared_blocked(user_id)
+
+    def block(self, user_id):
+        super().block(user_id)
+        self._share_block(user_id)
+
+    def check_message(self, user_id):
+        if self._shared_blocked(user_id):
+            return abuse.BAN
+        verdict = super().check_message(user_id)
+        if verdict == abuse.BAN:
+            self._share_block(user_id)
+        return verdict
+
+    def check_key_attempts(self, user_id):
+        if self._shared_blocked(user_id):
+            return abuse.BAN
+        verdict = super().check_key_attempts(user_id)
+        if verdict == abuse.BAN:
+            self._share_block(user_id)
+        return verdict
+
+    def sweep(self):
+        # Истекшие блокировки удаляются из файла в фоне, из снимка они
+        # пропадают при следующем перечитывании
+        self._write('DELETE FROM blocks WHERE blocked_until <= ?', (time.time(),))
+        return super().sweep()
+
+def _log_error(future):
+    if future.exception() is not None:
+        logger.error("Shared state access failed: %s", future.exception())
+
+def create_state(backend=STATE_BACKEND):
+    if backend == 'sqlite':
+        return SQLiteState()
+    if backend == 'memory':
+        return InProcessState()
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,49 @@
+# Миграции схемы на данных, записанных старой версией бота
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SCHEMA_VERSION, _migration_1_legacy, get_schema_version, migrate
+
+def legacy_db(path, birth_dates):
+    # Таблица в старом формате, строки - как их писал прежний add_user
+    conn = sqlite3.connect(path)
+    _migration_1_legacy(conn)
+    conn.execute('PRAGMA user_version = 1')
+    conn.executemany('''
+    INSERT INTO users (
+        user_id, birth_date, first_name, last_name, patronymic,
+        phone_number, military_spec, dental_sanation, medical_certificates,
+        foreign_passport, active_contracts, registration_date
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (user_id, birth_date, 'Иван', 'Иванов', 'Иванович', f'+7999000000{user_id}',
+         '837; Плотник', True, False, True, False, datetime(2024, 5, 1, 12, 0))
+        for user_id, birth_date in enumerate(birth_dates, start=1)
+    ])
+    conn.commit()
+    return conn
+
+def test_legacy_birth_dates_are_converted(tmp_path):
+    conn = legacy_db(tmp_path / 'users.db', ['15.03.1985', '1.2.1990', '01.2.1990', None])
+    assert migrate(conn) == SCHEMA_VERSION
+    rows = conn.execute('''
+    SELECT birth_date, dental_sanation, medical_certificates, registration_date
+    FROM users ORDER BY user_id
+    ''').fetchall()
+    assert [row[0] for row in rows] == [19850315, 19900201, 19900201, None]
+    assert rows[0][1:3] == (1, 0)
+    assert all(isinstance(row[3], int) for row in rows)
+
+def test_unparseable_birth_date_keeps_legacy_table(tmp_path):
+    conn = legacy_db(tmp_path / 'users.db', ['15.03.1985', '31.02.1990'])
+    with pytest.raises(ValueError):
+        migrate(conn)
+    assert get_schema_version(conn) == 1
+    rows = conn.execute('SELECT birth_date FROM users ORDER BY user_id').fetchall()
+    assert rows == [('15.03.1985',), ('31.02.1990',)]
@@ -1,12 +1,105 @@
 from datetime import datetime, timedelta
+import asyncio
+import csv
+import gzip
+import heapq
+import io
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
+import sqlite3
+import time
+from itertools import chain, islice
+# openpyxl импортируется внутри функций, которые собирают XLSX: он нужен
+# только процессам пула отчетов, а бот без него запускается быстрее
+from database import decode_birth_date, from_timestamp, to_timestamp
+import metrics
+
+REPORT_CHUNK_SIZE = 1000  # Сколько строк забираем из БД за один fetchmany
+# Большие отчеты делятся на листы и файлы, чтобы их открывали Excel и телефоны,
+# а файл не упирался в лимит Telegram на документы (50 МБ)
+REPORT_SHEET_ROWS = int(os.getenv('REPORT_SHEET_ROWS', '50000'))  # Строк на одном листе
+REPORT_FILE_ROWS = int(os.getenv('REPORT_FILE_ROWS', '100000'))  # Строк в одном файле
+REPORT_PAGE_SIZE = 5000  # Строк в одном запросе постраничного чтения
+
+REPORT_HEADERS = [
+    'Фамилия', 'Имя', 'Отчество', 'Дата рождения', 'Телефон',
+    'ВУС и профессия', 'Санация', 'Справки', 'Загранпаспорт',
+    'Контракты', 'Дата регистрации'
+]
+REPORT_COLUMN_WIDTHS = [15, 15, 15, 15, 15, 30, 10, 10, 12, 10, 20]
+BOOLEAN_COLUMNS = (6, 7, 8, 9)  # Индексы булевых столбцов в строке отчета
+BIRTH_DATE_COLUMN = 3
+REGISTRATION_DATE_COLUMN = 10
+
+EXPORT_CHUNK_SIZE = 5000  # Строк за один fetchmany при выгрузке в CSV
+EXPORT_COMPRESS_LEVEL = 6  # Уровень gzip: 9 заметно медленнее при почти том же размере
+
+REPORT_FILE_TTL = 3600  # Файлы отчетов старше часа удаляются
+REPORT_CACHE_MAX_ROWS = 20000  # Сверх этого в кэше хранится только готовый файл
+
+REPORT_SECONDS = metrics.Histogram(
+    'bot_report_seconds', 'Время подготовки отчета', ('period', 'source')
+)
+REPORT_BYTES = metrics.Histogram(
+    'bot_report_bytes', 'Размер файла отчета', ('period',), buckets=metrics.SIZE_BUCKETS
+)
+
+REPORT_COLUMNS = '''
+        last_name, first_name, patronymic, birth_date, phone_number,
+        military_spec, dental_sanation, medical_certificates,
+        foreign_passport, active_contracts, registration_date'''
+
+# Выгрузка за произвольный период: [начало, конец), по индексу даты регистрации.
+# Значения форматирует сам SQLite, строки курсора сразу пишутся в CSV
+EXPORT_QUERY = '''
+    SELECT
+        last_name, first_name, patronymic,
+        CASE WHEN birth_date IS NOT NULL THEN
+            printf('%02d.%02d.%04d', birth_date % 100, birth_date / 100 % 100, birth_date / 10000)
+        END,
+        phone_number, military_spec,
+        CASE dental_sanation WHEN 1 THEN 'Да' ELSE 'Нет' END,
+        CASE medical_certificates WHEN 1 THEN 'Да' ELSE 'Нет' END,
+        CASE foreign_passport WHEN 1 THEN 'Да' ELSE 'Нет' END,
+        CASE active_contracts WHEN 1 THEN 'Да' ELSE 'Нет' END,
+        strftime('%d.%m.%Y %H:%M:%S', registration_date, 'unixepoch', 'localtime')
+    FROM users
+    WHERE registration_date >= ? AND registration_date < ?
+    ORDER BY registration_date
+    '''
+
+# Постраничное чтение по ключу (registration_date, user_id): каждая страница -
+# отдельный короткий запрос по индексу, без OFFSET и без долгой транзакции чтения
+PAGE_QUERY = f'''
+    SELECT {REPORT_COLUMNS}, user_id
+    FROM users
+    WHERE registration_date >= ? AND (registration_date, user_id) < (?, ?)
+    ORDER BY registration_date DESC, user_id DESC
+    LIMIT ?
+    '''
+
+# То же только для пользователей с кодом ВУС: страница берется из индекса
+# user_vus (code, registration_date, user_id) уже в нужном порядке,
+# строки анкет - по первичному ключу users
+VUS_PAGE_QUERY = f'''
+    SELECT {', '.join('u.' + column.strip() for column in REPORT_COLUMNS.split(','))}, u.user_id
+    FROM user_vus v CROSS JOIN users u ON u.user_id = v.user_id
+    WHERE v.code = ? AND v.registration_date >= ?
+        AND (v.registration_date, v.user_id) < (?, ?)
+    ORDER BY v.registration_date DESC, v.user_id DESC
+    LIMIT ?
+    '''
+
+# Для кэша дополнительно выбираем user_id, чтобы не задвоить строки при дочитке
+CACHED_REPORT_QUERY = f'''
+    SELECT {REPORT_COLUMNS}, user_id
+    FROM users 
+    WHERE registration_date >= ? 
+    ORDER BY registration_date DESC
+    '''
+
+def get_report_period(period, now=None):
+    now = now or datetime.now()
 
-def generate_excel_report(db, period):
-    now = datetime.now()
-    
     if period == 'day':
         start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
         period_name = "за сегодня"
@@ -19,84 +112,462 @@ def generate_excel_report(db, period):
     elif period == 'year':
         start_date = now - timedelta(days=365)
         period_name = "за год"
-    
-    cursor = db.conn.cursor()
-    cursor.execute('''
-    SELECT 
-        last_name, first_name, patronymic, birth_date, phone_number,
-        military_spec, dental_sanation, medical_certificates,
-        foreign_passport, active_contracts, registration_date
-    FROM users 
-    WHERE registration_date >= ? 
-    ORDER BY registration_date DESC
-    ''', (start_date,))
-    
-    data = cursor.fetchall()
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчет"
-    
-    # Заголовок отчета
-    ws['A1'] = f"Отчет по регистрациям {period_name}"
-    ws.merge_cells('A1:K1')
-    title_cell = ws['A1']
-    title_cell.font = Font(size=14, bold=True)
-    title_cell.alignment = Alignment(horizontal='center')
-    
-    # Заголовки столбцов
-    headers = [
-        'Фамилия', 'Имя', 'Отчество', 'Дата рождения', 'Телефон',
-        'ВУС и профессия', 'Санация', 'Справки', 'Загранпаспорт',
-        'Контракты', 'Дата регистрации'
-    ]
-    
-    # Стили для заголовков и ячеек
-    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-    header_font = Font(bold=True)
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Применяем заголовки и стили
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=2, column=col, value=header)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', wrap_text=True)
-        cell.border = thin_border
-    
-    # Записываем данные
-    for row_idx, row in enumerate(data, 3):
-        for col_idx, value in enumerate(row, 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            # Преобразуем булевы значения
-            if isinstance(value, int) and col_idx in [7, 8, 9, 10]:
-                cell.value = "Да" if value else "Нет"
-            else:
-                cell.value = value
-            cell.alignment = Alignment(horizontal='center', wrap_text=True)
-            cell.border = thin_border
-    
-    # Устанавливаем ширину столбцов
-    column_widths = [15, 15, 15, 15, 15, 30, 10, 10, 12, 10, 20]
-    for i, width in enumerate(column_widths, 1):
+    else:
+        raise ValueError(f"Unknown period: {period}")
+
+    return start_date, period_name
+
+def _register_report_styles(wb):
+    # Общие именованные стили: ячейки ссылаются на них, а не создают свои объекты
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    wb.add_named_style(NamedStyle(
+        name='report_title',
+        font=Font(size=14, bold=True),
+        alignment=Alignment(horizontal='center')
+    ))
+    wb.add_named_style(NamedStyle(
+        name='report_header',
+        font=Font(bold=True),
+        fill=PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"),
+        alignment=Alignment(horizontal='center', wrap_text=True),
+        border=border
+    ))
+    wb.add_named_style(NamedStyle(
+        name='report_cell',
+        alignment=Alignment(horizontal='center', wrap_text=True),
+        border=border
+    ))
+
+def format_report_row(row):
+    # Лишние служебные столбцы (например, user_id для кэша) в отчет не попадают
+    row = list(row[:len(REPORT_HEADERS)])
+    # Преобразуем булевы значения
+    for idx in BOOLEAN_COLUMNS:
+        if isinstance(row[idx], int):
+            row[idx] = "Да" if row[idx] else "Нет"
+    # Даты хранятся в БД целыми числами
+    row[BIRTH_DATE_COLUMN] = decode_birth_date(row[BIRTH_DATE_COLUMN])
+    row[REGISTRATION_DATE_COLUMN] = from_timestamp(row[REGISTRATION_DATE_COLUMN])
+    return row
+
+def _styled_row(ws, values, style):
+    from openpyxl.cell import WriteOnlyCell
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        cells.append(cell)
+    return cells
+
+def _write_styled_rows(ws, rows, style):
+    # Строка сериализуется сразу при append, поэтому одни и те же
+    # ячейки со стилем переиспользуются для всех строк данных
+    cells = _styled_row(ws, [None] * len(REPORT_HEADERS), style)
+    for row in rows:
+        for cell, value in zip(cells, format_report_row(row)):
+            cell.value = value
+        ws.append(cells)
+
+def _create_report_sheet(wb, title, period_name):
+    from openpyxl.utils import get_column_letter
+    ws = wb.create_sheet(title)
+
+    # Ширину столбцов нужно задать до записи первой строки
+    for i, width in enumerate(REPORT_COLUMN_WIDTHS, 1):
         ws.column_dimensions[get_column_letter(i)].width = width
-    
-    filename = f'report_{period}_{now.strftime("%Y%m%d_%H%M%S")}.xlsx'
-    wb.save(filename)
-    return filename
 
-def cleanup_old_reports():
-    current_time = datetime.now()
+    ws.append(_styled_row(ws, [f"Отчет по регистрациям {period_name}"], 'report_title'))
+    ws.merged_cells.add(f'A1:{get_column_letter(len(REPORT_HEADERS))}1')
+    ws.append(_styled_row(ws, REPORT_HEADERS, 'report_header'))
+    return ws
+
+def write_report_workbook(rows, period_name, output, sheet_rows=REPORT_SHEET_ROWS):
+    # Потоковая запись: write-only лист сбрасывает строки на диск по мере добавления.
+    # Каждые sheet_rows строк начинается новый лист со своим заголовком.
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    _register_report_styles(wb)
+
+    rows = iter(rows)
+    sheet = 1
+    while True:
+        ws = _create_report_sheet(wb, "Отчет" if sheet == 1 else f"Отчет {sheet}", period_name)
+        _write_styled_rows(ws, islice(rows, sheet_rows), 'report_cell')
+        first = next(rows, None)
+        if first is None:
+            break
+        rows = chain((first,), rows)
+        sheet += 1
+
+    wb.save(output)
+    return output
+
+def render_report(rows, period_name, sheet_rows=REPORT_SHEET_ROWS):
+    output = io.BytesIO()
+    write_report_workbook(rows, period_name, output, sheet_rows)
+    return output.getvalue()
+
+def build_report(db_path, start_ts, period_name, max_rows, chunk_size=REPORT_CHUNK_SIZE):
+    # Выполняется в процессе из пула: открывает свое соединение только для чтения.
+    # Возвращает готовый файл, строки (если их не больше max_rows) и самую раннюю дату.
+    rows = []
+    oldest = None
+
+    def collect(cursor):
+        nonlocal rows, oldest
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                oldest = row[REGISTRATION_DATE_COLUMN]
+                if rows is not None:
+                    rows.append(row)
+                    if len(rows) > max_rows:
+                        rows = None
+                yield row
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(CACHED_REPORT_QUERY, (start_ts,))
+        content = render_report(collect(cursor), period_name)
+    finally:
+        conn.close()
+    return content, rows, oldest
+
+def iter_export_rows(cursor, chunk_size=EXPORT_CHUNK_SIZE):
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        yield from chunk
+
+def write_export_csv(rows, output):
+    # CSV сразу сжимается в output: в памяти только сжатый результат
+    # и буферы gzip, сколько бы строк ни было за период.
+    # utf-8-sig и ';' - чтобы Excel открыл файл с кириллицей без настройки
+    with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=EXPORT_COMPRESS_LEVEL) as gz:
+        text = io.TextIOWrapper(gz, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text, delimiter=';')
+        writer.writerow(REPORT_HEADERS)
+        writer.writerows(rows)
+        # Отцепляем обертку, иначе она закроет и gz, и output
+        text.flush()
+        text.detach()
+    return output
+
+def build_export(db_path, start_ts, end_ts, chunk_size=EXPORT_CHUNK_SIZE):
+    # Выполняется в процессе из пула отчетов. Возвращает содержимое .csv.gz
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(EXPORT_QUERY, (start_ts, end_ts))
+        output = write_export_csv(iter_export_rows(cursor, chunk_size), io.BytesIO())
+    finally:
+        conn.close()
+    return output.getvalue()
+
+def iter_report_pages(conn, start_ts, after, limit, page_size=REPORT_PAGE_SIZE, vus=None):
+    # Строки периода начиная после ключа after (registration_date, user_id),
+    # не больше limit, при vus - только с этим кодом ВУС.
+    # Последний столбец строки - user_id.
+    date, user_id = after
+    while limit > 0:
+        if vus is None:
+            page = conn.execute(
+                PAGE_QUERY, (start_ts, date, user_id, min(page_size, limit))
+            ).fetchall()
+        else:
+            page = conn.execute(
+                VUS_PAGE_QUERY, (vus, start_ts, date, user_id, min(page_size, limit))
+            ).fetchall()
+        if not page:
+            break
+        yield from page
+        limit -= len(page)
+        date, user_id = page[-1][REGISTRATION_DATE_COLUMN], page[-1][-1]
+
+def build_report_part(db_path, start_ts, period_name, after, file_rows=REPORT_FILE_ROWS,
+                      sheet_rows=REPORT_SHEET_ROWS, vus=None):
+    # Выполняется в процессе из пула: одна часть большого отчета, не больше
+    # file_rows строк после ключа after. Возвращает файл и ключ последней
+    # строки или None, если это последняя часть.
+    last = None
+
+    def collect(rows):
+        nonlocal last
+        for row in rows:
+            last = row
+            yield row
+
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        pages = iter_report_pages(conn, start_ts, after, file_rows, vus=vus)
+        content = render_report(collect(pages), period_name, sheet_rows)
+        key = None
+        if last is not None:
+            key = (last[REGISTRATION_DATE_COLUMN], last[-1])
+            if next(iter_report_pages(conn, start_ts, key, 1, vus=vus), None) is None:
+                key = None
+    finally:
+        conn.close()
+    return content, key
+
+class _CachedReport:
+    def __init__(self, version, start_date, content):
+        self.version = version
+        self.start_date = start_date
+        self.content = content
+        # Строки хранятся только для небольших периодов, иначе None
+        self.rows = None
+        self.user_ids = None
+        self.oldest = None  # Самая ранняя дата регистрации в отчете
+
+class _PartsBuild:
+    # Одна сборка многочастного отчета на всех, кто его запросил одновременно.
+    # parts - future частей по порядку: результат (имя файла, содержимое) или
+    # None после последней части. Future следующей части появляется раньше,
+    # чем готова текущая, поэтому читатель всегда находит, чего ждать.
+    def __init__(self):
+        self.parts = [asyncio.get_running_loop().create_future()]
+        self.readers = 0
+        self.task = None
+
+# Результаты проверки кэша
+_CACHE_HIT = 0  # Готовый файл актуален
+_CACHE_RERENDER = 1  # Строки в кэше обновлены, нужно пересобрать файл
+_CACHE_REBUILD = 2  # Нужна полная сборка из БД
+
+class ReportCache:
+    # Кэш отчетов по периодам. Повтор без новых регистраций отдается сразу,
+    # а несколько новых строк дочитываются по user_id без полного пересчета.
+    # Сборка файла идет в executor (пул процессов), одновременные запросы
+    # одного отчета (период и код ВУС) ждут одну и ту же сборку, в том числе
+    # многочастную.
+    def __init__(self, db, executor=None, max_rows=REPORT_CACHE_MAX_ROWS,
+                 file_rows=REPORT_FILE_ROWS):
+        self.db = db
+        self.executor = executor
+        self.max_rows = max_rows
+        self.file_rows = file_rows
+        self._entries = {}
+        self._inflight = {}
+        self._inflight_parts = {}  # (период, ВУС) -> _PartsBuild
+
+    def invalidate(self, period=None):
+        if period is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(period, None)
+
+    async def get(self, period):
+        # Возвращает имя файла и содержимое отчета в байтах
+        future = self._inflight.get(period)
+        if future is None:
+            future = asyncio.ensure_future(self._get(period))
+            self._inflight[period] = future
+            future.add_done_callback(lambda _: self._inflight.pop(period, None))
+        content = await asyncio.shield(future)
+        filename = f'report_{period}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        return filename, content
+
+    async def parts(self, period, vus=None):
+        # Асинхронно выдает (имя файла, содержимое) по мере готовности.
+        # Отчет, который помещается в один файл, идет через кэш, а больший
+        # собирается по частям: пока отправляется часть, собирается следующая.
+        # Отчеты по коду ВУС не кэшируются.
+        start_date, period_name = get_report_period(period)
+        start_ts = to_timestamp(start_date)
+        count = await self.db.count_registrations_async(start_ts, vus)
+        if vus is None and count <= self.file_rows:
+            yield await self.get(period)
+            return
+
+        key = (period, vus)
+        build = self._inflight_parts.get(key)
+        if build is None:
+            build = self._inflight_parts[key] = _PartsBuild()
+            build.task = asyncio.ensure_future(
+                self._build_parts(build, period, period_name, start_ts, count, vus)
+            )
+            build.task.add_done_callback(lambda _: self._finish_parts(key, build))
+
+        build.readers += 1
+        try:
+            index = 0
+            while True:
+                # shield: отмена одного читателя не отменяет часть для остальных
+                part = await asyncio.shield(build.parts[index])
+                if part is None:
+                    return
+                yield part
+                index += 1
+        finally:
+            build.readers -= 1
+            # Отчет больше никто не ждет - дальше не собираем
+            if not build.readers and not build.task.done():
+                build.task.cancel()
+                self._finish_parts(key, build)
+
+    async def _build_parts(self, build, period, period_name, start_ts, count, vus):
+        # Собирает части по очереди и выкладывает их в build.parts.
+        # Части держатся в памяти, пока сборка не закончится: их могут
+        # дочитывать те, кто подключился позже
+        name = period
+        source = 'part'
+        if vus is not None:
+            name = f'{period}_vus{vus}'
+            period_name = f"{period_name}, ВУС {vus}"
+            source = 'vus'
+        several = count > self.file_rows
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        loop = asyncio.get_running_loop()
+        after = (float('inf'), 0)
+        part = 1
+        try:
+            while after is not None:
+                started = time.perf_counter()
+                content, after = await self._in_executor(
+                    build_report_part, self.db.path, start_ts,
+                    f"{period_name} (часть {part})" if several else period_name,
+                    after, self.file_rows, REPORT_SHEET_ROWS, vus
+                )
+                REPORT_SECONDS.labels(period, source).observe(time.perf_counter() - started)
+                REPORT_BYTES.labels(period).observe(len(content))
+                suffix = f'_part{part}' if several else ''
+                current = build.parts[-1]
+                build.parts.append(loop.create_future())
+                current.set_result((f'report_{name}_{stamp}{suffix}.xlsx', content))
+                part += 1
+            build.parts[-1].set_result(None)
+        except Exception as e:
+            build.parts[-1].set_exception(e)
+
+    def _finish_parts(self, key, build):
+        if self._inflight_parts.get(key) is build:
+            del self._inflight_parts[key]
+
+    async def _in_executor(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _get(self, period):
+        started = time.perf_counter()
+        content, source = await self._prepare(period)
+        REPORT_SECONDS.labels(period, source).observe(time.perf_counter() - started)
+        REPORT_BYTES.labels(period).observe(len(content))
+        return content
+
+    async def _prepare(self, period):
+        # Возвращает содержимое отчета и откуда оно взято: cache, rerender или build
+        start_date, period_name = get_report_period(period)
+        try:
+            entry = self._entries.get(period)
+            if entry is not None:
+                status = await self.db._run(self._refresh_rows, entry, start_date)
+                if status == _CACHE_HIT:
+                    return entry.content, 'cache'
+                if status == _CACHE_RERENDER:
+                    entry.content = await self._in_executor(render_report, entry.rows, period_name)
+                    return entry.content, 'rerender'
+
+            version = self.db.data_version
+            content, rows, oldest = await self._in_executor(
+                build_report, self.db.path, to_timestamp(start_date), period_name, self.max_rows
+            )
+        except Exception:
+            self._entries.pop(period, None)
+            raise
+
+        entry = _CachedReport(version, start_date, content)
+        entry.oldest = oldest
+        if rows is not None:
+            entry.rows = rows
+            entry.user_ids = {row[-1] for row in rows}
+        self._entries[period] = entry
+        return content, 'build'
+
+    def _refresh_rows(self, entry, start_date):
+        # Выполняется в потоке БД: проверяет версию и дочитывает новые строки
+        changes = self.db.changes_since(entry.version)
+        version = self.db.data_version
+        expired = entry.oldest is not None and entry.oldest < self._date_key(start_date)
+
+        # None означает, что журнал изменений уже не покрывает разрыв в версиях:
+        # это не "изменений нет", а повод перестроить отчет
+        if changes == [] and not expired:
+            # Новых регистраций нет и ни одна строка не выпала из периода
+            entry.version = version
+            return _CACHE_HIT
+
+        if entry.rows is None or changes is None:
+            return _CACHE_REBUILD
+
+        new_ids = [user_id for user_id in changes if user_id not in entry.user_ids]
+        new_rows = self._fetch_users(new_ids, start_date)
+
+        # Новые регистрации самые свежие, поэтому идут в начало отчета
+        entry.rows[:0] = new_rows
+        entry.user_ids.update(row[-1] for row in new_rows)
+
+        # Строки, вышедшие за начало периода, отрезаем с конца
+        start_key = self._date_key(start_date)
+        while entry.rows and entry.rows[-1][REGISTRATION_DATE_COLUMN] < start_key:
+            entry.user_ids.discard(entry.rows.pop()[-1])
+
+        if len(entry.rows) > self.max_rows:
+            return _CACHE_REBUILD
+
+        entry.version = version
+        entry.start_date = start_date
+        entry.oldest = entry.rows[-1][REGISTRATION_DATE_COLUMN] if entry.rows else None
+        return _CACHE_RERENDER
+
+    def _fetch_users(self, user_ids, start_date):
+        if not user_ids:
+            return []
+        placeholders = ', '.join('?' * len(user_ids))
+        with self.db.reader() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+            SELECT {REPORT_COLUMNS}, user_id
+            FROM users
+            WHERE user_id IN ({placeholders}) AND registration_date >= ?
+            ORDER BY registration_date DESC
+            ''', (*user_ids, to_timestamp(start_date)))
+            return cursor.fetchall()
+
+    @staticmethod
+    def _date_key(value):
+        # Даты регистрации хранятся в БД как unix-время
+        return to_timestamp(value)
+
+# Очередь файлов отчетов по сроку удаления (deadline, filename)
+_report_files = []
+
+def track_report_file(filename, created=None):
+    created = time.time() if created is None else created
+    heapq.heappush(_report_files, (created + REPORT_FILE_TTL, filename))
+
+def scan_leftover_reports():
+    # Однократно при запуске ставим в очередь файлы, оставшиеся с прошлого запуска
     for file in os.listdir():
-        if file.startswith('report_') and file.endswith('.xlsx'):  # Изменил расширение на xlsx
-            file_time = datetime.fromtimestamp(os.path.getctime(file))
-            if (current_time - file_time).total_seconds() > 3600:  # Старше часа
-                try:
-                    os.remove(file)
-                except:
-                    pass 
\ No newline at end of file
+        if file.startswith('report_') and file.endswith('.xlsx'):
+            try:
+                track_report_file(file, os.path.getctime(file))
+            except OSError:
+                pass
+
+def cleanup_old_reports(now=None):
+    # Удаляем только файлы с истекшим сроком, не обходя рабочую директорию
+    now = time.time() if now is None else now
+    removed = 0
+    while _report_files and _report_files[0][0] <= now:
+        _, file = heapq.heappop(_report_files)
+        try:
+            os.remove(file)
+            removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,168 @@
+# Правила проверки анкеты. Используются обработчиками бота по одному полю
+# и импортом списков кандидатов (import_users.py) сразу для пачки строк.
+import re
+from datetime import date, datetime
+
+MIN_AGE = 18
+MAX_AGE = 65
+
+NAME_RE = re.compile(r'^[А-ЯЁа-яё\s-]{2,50}$')
+# Та же запись, что принимает strptime('%d.%m.%Y')
+DATE_RE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+
+def validate_date(date_str):
+    try:
+        birth_date = datetime.strptime(date_str, '%d.%m.%Y')
+        today = datetime.now()
+        age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+        
+        if age < MIN_AGE or age > MAX_AGE:
+            return False
+        return True
+    except ValueError:
+        return False
+
+def validate_name(name):
+    return bool(NAME_RE.match(name))
+
+def format_phone_digits(phone_str):
+    # Проверяем длину номера (от 10 до 15 цифр по международному стандарту)
+    if not (10 <= len(phone_str) <= 15):
+        return None
+        
+    # Если номер начинается с 8, считаем его российским
+    if phone_str.startswith('8'):
+        return '+7' + phone_str[1:]
+    # Если начинается с 7, добавляем +
+    if phone_str.startswith('7'):
+        return '+' + phone_str
+    # Если короткий номер (10 цифр), считаем российским
+    if len(phone_str) == 10:
+        return '+7' + phone_str
+    # Иначе добавляем + для международного формата
+    return '+' + phone_str
+
+def validate_phone(phone_str):
+    try:
+        # Удаляем все пробелы и другие символы из номера
+        phone_str = ''.join(filter(str.isdigit, phone_str))
+        formatted_number = format_phone_digits(phone_str)
+        return formatted_number is not None, formatted_number
+    except Exception:
+        return False, None
+
+def phone_key(phone_str):
+    # Номер как целое число для поиска дубликатов:
+    # '8 (999) 123-45-67' и '+79991234567' -> 79991234567
+    is_valid, formatted_number = validate_phone(phone_str)
+    return int(formatted_number[1:]) if is_valid else None
+
+def validate_military_spec(text):
+    # Если указано "нет", это валидное значение
+    if text.lower() == 'нет':
+        return True, 'нет'
+        
+    parts = text.split(';')
+    if len(parts) != 2:
+        return False, None
+        
+    vus_part, prof_part = parts
+    
+    # Обрабатываем ВУС
+    specs = []
+    for spec in vus_part.split(','):
+        # Извлекаем только цифры из каждой части
+        digits = ''.join(filter(str.isdigit, spec))
+        if digits:  # Если остались цифры
+            specs.append(digits)
+    
+    # Проверяем каждый ВУС на соответствие формату (3-4 цифры)
+    if not specs or not all(3 <= len(spec) <= 4 for spec in specs):
+        return False, None
+            
+    # Форматируем результат: ВУС + профессии
+    formatted_vus = ', '.join(sorted(specs))
+    formatted_prof = prof_part.strip()
+    
+    if not formatted_prof:  # Если профессия не указана
+        return False, None
+        
+    return True, f"{formatted_vus}; {formatted_prof}"
+
+def validate_vus_code(code):
+    # Один код ВУС, как в validate_military_spec: 3-4 цифры
+    return code.isdigit() and 3 <= len(code) <= 4
+
+BOOLEAN_VALUES = {
+    'да': 1, 'нет': 0, '1': 1, '0': 0,
+    'true': 1, 'false': 0, 'yes': 1, 'no': 0,
+}
+
+def date_key(day):
+    # Дата как целое ГГГГММДД: так в БД хранятся дата рождения и дни сводок /stats
+    return day.year * 10000 + day.month * 100 + day.day
+
+class RowValidator:
+    # Проверка строк импорта по тем же правилам, что и в анкете.
+    # Все, что не зависит от строки (сегодняшняя дата, границы возраста,
+    # скомпилированные выражения), вычисляется один раз на весь импорт.
+    # Строка - кортеж (фамилия, имя, отчество, дата рождения, телефон, ВУС,
+    # санация, справки, загранпаспорт, контракты).
+    def __init__(self, today=None):
+        today = today or date.today()
+        # Возраст от MIN_AGE до MAX_AGE лет включительно - это диапазон дат рождения
+        self.latest_birth = (today.year - MIN_AGE) * 10000 + today.month * 100 + today.day
+        self.earliest_birth = (today.year - MAX_AGE - 1) * 10000 + today.month * 100 + today.day
+
+    def validate(self, row):
+        # Возвращает (параметры для INSERT без user_id и даты регистрации, None)
+        # или (None, причина отказа)
+        if len(row) < 10:
+            return None, 'не хватает столбцов'
+        last_name, first_name, patronymic, birth_date, phone, spec = (
+            str(value).strip() if value is not None else '' for value in row[:6]
+        )
+
+        name_match = NAME_RE.match
+        if not (name_match(last_name) and name_match(first_name) and name_match(patronymic)):
+            return None, 'неверный формат ФИО'
+
+        # В XLSX дата рождения обычно ячейка с датой: openpyxl отдает datetime
+        # (подкласс date), разбирать нужно только текст
+        if isinstance(row[3], date):
+            birth_key = date_key(row[3])
+        else:
+            match = DATE_RE.fullmatch(birth_date)
+            if match is None:
+                return None, 'неверный формат даты рождения'
+            day, month, year = match.groups()
+            try:
+                birth_key = date_key(date(int(year), int(month), int(day)))
+            except ValueError:
+                return None, 'неверный формат даты рождения'
+        if not self.earliest_birth < birth_key <= self.latest_birth:
+            return None, 'возраст не соответствует требованиям'
+
+        is_valid, phone_number = validate_phone(phone)
+        if not is_valid:
+            return None, 'неверный формат номера телефона'
+
+        is_valid, military_spec = validate_military_spec(spec)
+        if not is_valid:
+            return None, 'неверный формат ВУС и профессии'
+
+        flags = []
+        for value in row[6:10]:
+            flag = BOOLEAN_VALUES.get(str(value).strip().lower() if value is not None else '')
+            if flag is None:
+                return None, 'ожидается Да или Нет'
+            flags.append(flag)
+
+        return (
+            birth_key, first_name, last_name, patronymic,
+            phone_number, military_spec, *flags
+        ), None
+
+    def validate_batch(self, rows):
+        validate = self.validate
+        return [validate(row) for row in rows]
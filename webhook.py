@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))  # Задачи разбора входящих обновлений
+WEBHOOK_QUEUE_SIZE = 10000  # Сколько необработанных запросов держим в памяти
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    # Локальный aiohttp-сервер: принимает обновления от Telegram, сразу
+    # отвечает 200, а разбор и передачу в application.update_queue
+    # выполняют несколько фоновых задач
+    def __init__(self, application, host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                 path=WEBHOOK_PATH, secret_token=None, workers=WEBHOOK_WORKERS,
+                 queue_size=WEBHOOK_QUEUE_SIZE):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self._incoming = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Если порт 0, узнаем выбранный системой
+        self.port = self._runner.addresses[0][1]
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("Webhook server listening on %s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self):
+        # Дорабатываем уже принятые обновления
+        await self._incoming.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _handle(self, request):
+        if self.secret_token and request.headers.get(SECRET_HEADER) != self.secret_token:
+            return web.Response(status=403)
+
+        body = await request.read()
+        try:
+            self._incoming.put_nowait(body)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        bot = self.application.bot
+        update_queue = self.application.update_queue
+        while True:
+            body = await self._incoming.get()
+            try:
+                update = Update.de_json(json.loads(body), bot)
+                await update_queue.put(update)
+            except Exception:
+                logger.exception("Failed to parse webhook update")
+            finally:
+                self._incoming.task_done()
+
+async def run_webhook(application, webhook_url, secret_token=None, allowed_updates=None):
+    # Жизненный цикл бота в режиме webhook вместо run_polling
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Порядок как в run_polling: post_shutdown вызывается после
+    # application.shutdown(), то есть после выхода из async with
+    try:
+        async with application:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates
+            )
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            server = WebhookServer(application, secret_token=secret_token)
+            await server.start()
+            try:
+                await stop.wait()
+            finally:
+                await server.stop()
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+    finally:
+        if application.post_shutdown:
+            await application.post_shutdown(application)